@@ -0,0 +1,109 @@
+"""
+Benchmark drawing synthetic maps of different sizes headlessly, with SDL's dummy video driver.
+
+Run with `python -m benchmarks`, and compare against earlier results with `--compare <file>`.
+"""
+
+import json
+import os
+import platform
+import sys
+import time
+from argparse import ArgumentParser
+from contextlib import suppress
+from importlib.metadata import PackageNotFoundError, version
+from typing import Any
+
+os.environ.setdefault("SDL_VIDEODRIVER", "dummy")
+
+import pygame  # noqa: E402
+
+from benchmarks.frames import benchmark_state  # noqa: E402
+from benchmarks.scenarios import SCALES, build_state  # noqa: E402
+
+
+def main() -> None:
+    parser = ArgumentParser(prog="python -m benchmarks", description="Benchmark drawing maps of different sizes.")
+    parser.add_argument("--scales", nargs="+", choices=list(SCALES), default=["small", "medium"])
+    parser.add_argument("--frames", type=int, default=60, help="Frames to draw for each measurement")
+    parser.add_argument("--display", type=int, nargs=2, default=(1200, 800), metavar=("WIDTH", "HEIGHT"))
+    parser.add_argument("--output", default="benchmark.json", help="File to write the results to as JSON")
+    parser.add_argument("--compare", default=None, help="Earlier results to compare against")
+    args = parser.parse_args()
+
+    pygame.init()
+    display = pygame.display.set_mode(tuple(args.display), flags=pygame.SRCALPHA)
+
+    results: dict[str, Any] = {"meta": metadata(args.display, args.frames), "scales": {}}
+    for name in args.scales:
+        scale = SCALES[name]
+        start = time.perf_counter()
+        state = build_state(scale)
+        build_time = time.perf_counter() - start
+        results["scales"][name] = {
+            "entities": {
+                "fog_cells": len(state.map.removed_fog),
+                "pieces": len(state.map.pieces),
+                "markings": len(state.map.markings),
+                "image_size": list(scale.image_size),
+            },
+            "build_s": build_time,
+            "timings": benchmark_state(display, state, args.frames),
+        }
+        report(name, results["scales"][name]["timings"])
+
+    with open(args.output, "w") as f:
+        json.dump(results, f, indent=2)
+
+    if args.compare is not None:
+        with open(args.compare, "r") as f:
+            compare(json.load(f), results)
+
+    pygame.quit()
+
+
+def metadata(display_size: tuple[int, int], frames: int) -> dict[str, Any]:
+    dndfog_version = "unknown"
+    with suppress(PackageNotFoundError):
+        dndfog_version = version("dndfog")
+
+    return {
+        "dndfog": dndfog_version,
+        "pygame": pygame.version.ver,
+        "sdl": ".".join(str(part) for part in pygame.get_sdl_version()),
+        "python": platform.python_version(),
+        "platform": platform.platform(),
+        "time": time.strftime("%Y-%m-%dT%H:%M:%S%z"),
+        "display": list(display_size),
+        "frames": frames,
+    }
+
+
+def report(scale: str, timings: dict[str, dict[str, float]]) -> None:
+    sys.stdout.write(f"\n{scale}\n")
+    for name, times in timings.items():
+        values = "  ".join(f"{key} {value:8.2f}" for key, value in times.items())
+        sys.stdout.write(f"  {name:<10} {values}\n")
+
+
+def compare(old: dict[str, Any], new: dict[str, Any]) -> None:
+    """Show how much each timing has changed, as a ratio of the new time to the old one."""
+    sys.stdout.write(f"\nCompared to {old['meta']['dndfog']} from {old['meta']['time']} (new / old)\n")
+    for scale, results in new["scales"].items():
+        old_results = old["scales"].get(scale)
+        if old_results is None:
+            continue
+
+        sys.stdout.write(f"\n{scale}\n")
+        for name, times in results["timings"].items():
+            old_times = old_results["timings"].get(name, {})
+            ratios = [
+                f"{key} {value / old_times[key]:6.2f}x"
+                for key, value in times.items()
+                if old_times.get(key)  # Skip missing and zero timings
+            ]
+            sys.stdout.write(f"  {name:<10} {'  '.join(ratios)}\n")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,114 @@
+import time
+from collections.abc import Callable
+
+import pygame
+
+from dndfog.camera import move_camera
+from dndfog.draw import draw
+from dndfog.draw.map import clear_layer_caches, draw_fog, draw_grid, draw_map, draw_markings, draw_pieces
+from dndfog.event_handlers import handle_mouse_wheel
+from dndfog.grid import grid_position
+from dndfog.types import LoopData, MapData, ProgramState
+
+__all__ = [
+    "benchmark_state",
+]
+
+LAYERS: dict[str, Callable[[pygame.Surface, MapData], None]] = {
+    "map": draw_map,
+    "grid": draw_grid,
+    "pieces": draw_pieces,
+    "fog": draw_fog,
+    "markings": draw_markings,
+}
+
+PAN_STEP: tuple[int, int] = (7, 5)
+"""How many pixels the camera moves between frames when panning."""
+
+
+def benchmark_state(display: pygame.Surface, state: ProgramState, frames: int) -> dict[str, dict[str, float]]:
+    """
+    Time drawing each layer of the map from scratch and while panning the camera,
+    and how long it takes to draw a whole frame after panning or zooming.
+    """
+    results = {name: layer_times(display, state, layer, frames) for name, layer in LAYERS.items()}
+    results["pan"] = pan_times(display, state, frames)
+    results["zoom"] = zoom_times(display, state, frames)
+    return results
+
+
+def layer_times(
+    display: pygame.Surface,
+    state: ProgramState,
+    layer: Callable[[pygame.Surface, MapData], None],
+    frames: int,
+) -> dict[str, float]:
+    start_camera = state.map.camera
+    clear_layer_caches(state.map)
+    cold = _timed(lambda: layer(display, state.map))
+
+    times: list[float] = []
+    for _ in range(frames):
+        state.map.camera = move_camera(state.map.camera, PAN_STEP)
+        times.append(_timed(lambda: layer(display, state.map)))
+
+    state.map.camera = start_camera
+    return {"cold_ms": cold, **summary(times)}
+
+
+def pan_times(display: pygame.Surface, state: ProgramState, frames: int) -> dict[str, float]:
+    start_camera = state.map.camera
+    loop = _loop_data(display, state)
+    times: list[float] = []
+    for _ in range(frames):
+        state.map.camera = move_camera(state.map.camera, PAN_STEP)
+        state.redraw.everything()
+        times.append(_timed(lambda: draw(display, loop, state)))
+
+    state.map.camera = start_camera
+    return summary(times)
+
+
+def zoom_times(display: pygame.Surface, state: ProgramState, frames: int) -> dict[str, float]:
+    """Zoom in one step at a time from the current zoom level, so that every frame needs newly scaled tiles."""
+    start = state.map.camera, state.map.gridsize, state.map.image_size
+    loop = _loop_data(display, state)
+
+    def zoom_and_draw() -> None:
+        handle_mouse_wheel(pygame.event.Event(pygame.MOUSEWHEEL, x=0, y=1), loop, state)
+        draw(display, loop, state)
+
+    times = [_timed(zoom_and_draw) for _ in range(frames)]
+
+    state.map.camera, state.map.gridsize, state.map.image_size = start
+    return summary(times)
+
+
+def summary(times: list[float]) -> dict[str, float]:
+    ordered = sorted(times)
+    return {
+        "p50_ms": _percentile(ordered, 50),
+        "p95_ms": _percentile(ordered, 95),
+        "max_ms": ordered[-1],
+    }
+
+
+def _percentile(ordered: list[float], percent: float) -> float:
+    return ordered[min(round(percent / 100 * (len(ordered) - 1)), len(ordered) - 1)]
+
+
+def _timed(func: Callable[[], None]) -> float:
+    start = time.perf_counter()
+    func()
+    return (time.perf_counter() - start) * 1000
+
+
+def _loop_data(display: pygame.Surface, state: ProgramState) -> LoopData:
+    mouse_pos = display.get_width() // 2, display.get_height() // 2
+    return LoopData(
+        mouse_pos=mouse_pos,
+        grid_pos=grid_position(mouse_pos, state.map.camera, state.map.gridsize),
+        mouse_speed=(0, 0),
+        pressed_modifiers=0,
+        pressed_buttons=(False, False, False),
+    )
@@ -0,0 +1,98 @@
+import random
+from dataclasses import dataclass
+from math import isqrt
+
+import pygame
+
+from dndfog.chunks import FogChunks
+from dndfog.map import build_mipmaps, clear_tile_cache
+from dndfog.markings import add_stroke
+from dndfog.piece import add_piece
+from dndfog.types import PieceSize, ProgramState, StrokeData
+
+__all__ = [
+    "SCALES",
+    "Scale",
+    "build_state",
+]
+
+
+@dataclass(frozen=True)
+class Scale:
+    fog_cells: int
+    pieces: int
+    markings: int
+    image_size: tuple[int, int]
+
+
+SCALES: dict[str, Scale] = {
+    "small": Scale(fog_cells=1_000, pieces=100, markings=1_000, image_size=(4096, 4096)),
+    "medium": Scale(fog_cells=100_000, pieces=300, markings=10_000, image_size=(8192, 8192)),
+    # Needs a few gigabytes of memory for the background map and its scaled tiles
+    "large": Scale(fog_cells=1_000_000, pieces=1_000, markings=50_000, image_size=(16384, 16384)),
+}
+"""Sizes of the synthetic maps to benchmark."""
+
+PATTERN_SIZE: int = 256
+"""Width and height of the random pattern the background map is tiled with."""
+
+
+def build_state(scale: Scale, seed: int = 0) -> ProgramState:
+    """
+    Build a map of the given scale, with randomly placed pieces, markings and revealed rooms
+    within the area covered by the background map. Revealed rooms spread further if they don't fit in it.
+    """
+    rng = random.Random(seed)
+    state = ProgramState()
+    state.map.gridsize = 36
+
+    image = background_map(scale.image_size, rng)
+    # Mipmaps are built here instead of in the background, so that they don't take time from the benchmarks
+    clear_tile_cache()
+    state.map.original_image = image
+    state.map.image_size = image.get_size()
+    build_mipmaps(image, state.map.mipmaps)
+
+    columns = scale.image_size[0] // state.map.gridsize
+    rows = scale.image_size[1] // state.map.gridsize
+    state.map.removed_fog = revealed_rooms(scale.fog_cells, columns, rows, rng)
+
+    while len(state.map.pieces) < scale.pieces:
+        place = rng.randrange(columns), rng.randrange(rows)
+        add_piece(place, state.map, state.colors, rng.choice(list(PieceSize)))
+
+    for _ in range(scale.markings):
+        x, y = rng.uniform(0, columns), rng.uniform(0, rows)
+        points = [(x + rng.uniform(-2, 2), y + rng.uniform(-2, 2)) for _ in range(10)]
+        color = (rng.randrange(256), rng.randrange(256), rng.randrange(256))
+        add_stroke(StrokeData(points=points, size=rng.choice([0.1, 0.25, 0.5]), color=color), state)
+
+    return state
+
+
+def background_map(size: tuple[int, int], rng: random.Random) -> pygame.Surface:
+    pattern = pygame.Surface((PATTERN_SIZE, PATTERN_SIZE))
+    for _ in range(200):
+        color = (rng.randrange(256), rng.randrange(256), rng.randrange(256))
+        rect = (rng.randrange(PATTERN_SIZE), rng.randrange(PATTERN_SIZE), rng.randrange(8, 64), rng.randrange(8, 64))
+        pygame.draw.rect(pattern, color, rect)
+
+    image = pygame.Surface(size)
+    image.blits(
+        [(pattern, (x, y)) for x in range(0, size[0], PATTERN_SIZE) for y in range(0, size[1], PATTERN_SIZE)],
+        doreturn=False,
+    )
+    return image.convert_alpha()
+
+
+def revealed_rooms(cell_count: int, columns: int, rows: int, rng: random.Random) -> FogChunks:
+    """Reveal random rectangular rooms until at least the given number of cells are revealed."""
+    # Leave room for the rooms to overlap
+    columns = rows = max(columns, rows, isqrt(2 * cell_count))
+    fog = FogChunks()
+    while len(fog) < cell_count:
+        width, height = rng.randint(3, 40), rng.randint(3, 40)
+        x, y = rng.randrange(max(columns - width, 1)), rng.randrange(max(rows - height, 1))
+        for row in range(y, y + height):
+            fog.add_span(x, row, width)
+    return fog
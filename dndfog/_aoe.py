@@ -4,7 +4,7 @@ from typing import TypedDict
 
 import pygame
 
-from dndfog.types import Glow
+from dndfog.types import Glow, get_glow
 
 
 class AreaOfEffectData(TypedDict):
@@ -23,7 +23,7 @@ def add_aoe(
     radius = gridsize // 2
     aoes[aoe_pos] = AreaOfEffectData(
         origin=aoe_pos,
-        glow=Glow(
+        glow=get_glow(
             radius_range=range(radius, radius - 1, -1),
             inner_color=color,
             outer_color=color,
@@ -53,7 +53,7 @@ def make_aoe(
     if radius != 0:
         aoes[aoe_pos] = AreaOfEffectData(
             origin=aoe_pos,
-            glow=Glow(
+            glow=get_glow(
                 radius_range=range(radius, radius - 1, -1),
                 inner_color=aoe["glow"].inner_color,
                 outer_color=aoe["glow"].outer_color,
@@ -95,7 +95,7 @@ def scale_aoes(
         rel_grid_radius = round(cur_radius / old_gridsize, 2)
         new_radius = max(int(rel_grid_radius * new_gridsize), new_gridsize // 2, 1)
 
-        aoes[place]["glow"] = Glow(
+        aoes[place]["glow"] = get_glow(
             radius_range=range(new_radius, new_radius - 1, -1),
             inner_color=aoe["glow"].inner_color,
             outer_color=aoe["glow"].outer_color,
@@ -0,0 +1,316 @@
+from collections import deque
+from collections.abc import Iterable, Iterator
+from itertools import count
+
+CHUNK_SHIFT: int = 6
+CHUNK_SIZE: int = 1 << CHUNK_SHIFT
+CHUNK_MASK: int = CHUNK_SIZE - 1
+CHUNK_AREA: int = CHUNK_SIZE * CHUNK_SIZE
+
+CHANGE_LOG_SIZE: int = 4096
+"""How many of the latest changes to remember, for finding out which cells have changed since a version."""
+
+_VERSIONS = count(1)
+_ONES = b"\x01" * CHUNK_SIZE
+
+__all__ = [
+    "FogChunks",
+]
+
+
+class FogChunks:
+    """
+    Set of grid cells, stored in square chunks of cells with one byte per cell.
+
+    Chunks without any cells in them are not stored at all, and chunks where every
+    cell is in the set are only flagged as full, so memory use grows with the outline
+    of the area covered instead of the number of cells in it.
+    """
+
+    __slots__ = ("_changes", "_chunks", "_counts", "_full", "_logged_since", "_size", "version")
+
+    def __init__(self, cells: Iterable[tuple[int, int]] = ()) -> None:
+        self._chunks: dict[tuple[int, int], bytearray] = {}
+        self._counts: dict[tuple[int, int], int] = {}
+        self._full: set[tuple[int, int]] = set()
+        self._size: int = 0
+        self.version: int = next(_VERSIONS)
+        """Changes every time cells are added or removed. Unique between all instances."""
+        self._changes: deque[tuple[int, int, int, int]] = deque()
+        """Latest changes as the version after the change, and the row of cells changed as (x, y, length)."""
+        self._logged_since: int = self.version
+        """Every change after this version is in the change log."""
+        self.update(cells)
+
+    def __contains__(self, cell: tuple[int, int]) -> bool:
+        x, y = cell
+        key = x >> CHUNK_SHIFT, y >> CHUNK_SHIFT
+        chunk = self._chunks.get(key)
+        if chunk is None:
+            return key in self._full
+        return chunk[((y & CHUNK_MASK) << CHUNK_SHIFT) | (x & CHUNK_MASK)] == 1
+
+    def __len__(self) -> int:
+        return self._size
+
+    def __iter__(self) -> Iterator[tuple[int, int]]:
+        for chunk_x, chunk_y in self._full:
+            start_x, start_y = chunk_x << CHUNK_SHIFT, chunk_y << CHUNK_SHIFT
+            for y in range(start_y, start_y + CHUNK_SIZE):
+                for x in range(start_x, start_x + CHUNK_SIZE):
+                    yield x, y
+
+        for (chunk_x, chunk_y), chunk in self._chunks.items():
+            start_x, start_y = chunk_x << CHUNK_SHIFT, chunk_y << CHUNK_SHIFT
+            index = chunk.find(1)
+            while index != -1:
+                yield start_x + (index & CHUNK_MASK), start_y + (index >> CHUNK_SHIFT)
+                index = chunk.find(1, index + 1)
+
+    def add(self, cell: tuple[int, int]) -> None:
+        x, y = cell
+        key = x >> CHUNK_SHIFT, y >> CHUNK_SHIFT
+        if key in self._full:
+            return
+
+        chunk = self._chunks.get(key)
+        if chunk is None:
+            chunk = self._chunks[key] = bytearray(CHUNK_AREA)
+            self._counts[key] = 0
+
+        index = ((y & CHUNK_MASK) << CHUNK_SHIFT) | (x & CHUNK_MASK)
+        if chunk[index]:
+            return
+
+        chunk[index] = 1
+        self._size += 1
+        self._log_change(x, y, 1)
+        self._counts[key] += 1
+        if self._counts[key] == CHUNK_AREA:
+            del self._chunks[key]
+            del self._counts[key]
+            self._full.add(key)
+
+    def discard(self, cell: tuple[int, int]) -> None:
+        x, y = cell
+        key = x >> CHUNK_SHIFT, y >> CHUNK_SHIFT
+        if key in self._full:
+            self._full.remove(key)
+            self._chunks[key] = bytearray(b"\x01" * CHUNK_AREA)
+            self._counts[key] = CHUNK_AREA
+
+        chunk = self._chunks.get(key)
+        if chunk is None:
+            return
+
+        index = ((y & CHUNK_MASK) << CHUNK_SHIFT) | (x & CHUNK_MASK)
+        if not chunk[index]:
+            return
+
+        chunk[index] = 0
+        self._size -= 1
+        self._log_change(x, y, 1)
+        self._counts[key] -= 1
+        if self._counts[key] == 0:
+            del self._chunks[key]
+            del self._counts[key]
+
+    def copy(self) -> "FogChunks":
+        other = FogChunks()
+        other._chunks = {key: chunk.copy() for key, chunk in self._chunks.items()}
+        other._counts = self._counts.copy()
+        other._full = self._full.copy()
+        other._size = self._size
+        return other
+
+    def add_span(self, x: int, y: int, length: int) -> None:
+        """Add `length` consecutive cells on row `y`, starting from column `x`."""
+        end = x + length
+        while x < end:
+            chunk_end = min(end, ((x >> CHUNK_SHIFT) + 1) << CHUNK_SHIFT)
+            self._add_chunk_span(x, y, chunk_end - x)
+            x = chunk_end
+
+    def _add_chunk_span(self, x: int, y: int, length: int) -> None:
+        key = x >> CHUNK_SHIFT, y >> CHUNK_SHIFT
+        if key in self._full:
+            return
+
+        chunk = self._chunks.get(key)
+        if chunk is None:
+            chunk = self._chunks[key] = bytearray(CHUNK_AREA)
+            self._counts[key] = 0
+
+        index = ((y & CHUNK_MASK) << CHUNK_SHIFT) | (x & CHUNK_MASK)
+        added = length - chunk.count(1, index, index + length)
+        if added == 0:
+            return
+
+        chunk[index : index + length] = _ONES[:length]
+        self._size += added
+        self._log_change(x, y, length)
+        self._counts[key] += added
+        if self._counts[key] == CHUNK_AREA:
+            del self._chunks[key]
+            del self._counts[key]
+            self._full.add(key)
+
+    def discard_span(self, x: int, y: int, length: int) -> None:
+        """Remove `length` consecutive cells on row `y`, starting from column `x`."""
+        end = x + length
+        while x < end:
+            chunk_end = min(end, ((x >> CHUNK_SHIFT) + 1) << CHUNK_SHIFT)
+            self._discard_chunk_span(x, y, chunk_end - x)
+            x = chunk_end
+
+    def _discard_chunk_span(self, x: int, y: int, length: int) -> None:
+        key = x >> CHUNK_SHIFT, y >> CHUNK_SHIFT
+        if key in self._full:
+            self._full.remove(key)
+            self._chunks[key] = bytearray(b"\x01" * CHUNK_AREA)
+            self._counts[key] = CHUNK_AREA
+
+        chunk = self._chunks.get(key)
+        if chunk is None:
+            return
+
+        index = ((y & CHUNK_MASK) << CHUNK_SHIFT) | (x & CHUNK_MASK)
+        removed = chunk.count(1, index, index + length)
+        if removed == 0:
+            return
+
+        chunk[index : index + length] = bytes(length)
+        self._size -= removed
+        self._log_change(x, y, length)
+        self._counts[key] -= removed
+        if self._counts[key] == 0:
+            del self._chunks[key]
+            del self._counts[key]
+
+    def spans(self) -> Iterator[tuple[int, int, int]]:
+        """Rows of consecutive cells in the set as (x, y, length). Rows are split where chunks change."""
+        for chunk_x, chunk_y in self._full:
+            start_x, start_y = chunk_x << CHUNK_SHIFT, chunk_y << CHUNK_SHIFT
+            for y in range(start_y, start_y + CHUNK_SIZE):
+                yield start_x, y, CHUNK_SIZE
+
+        for (chunk_x, chunk_y), chunk in self._chunks.items():
+            start_x, start_y = chunk_x << CHUNK_SHIFT, chunk_y << CHUNK_SHIFT
+            for row in range(CHUNK_SIZE):
+                row_start = row << CHUNK_SHIFT
+                row_end = row_start + CHUNK_SIZE
+                index = chunk.find(1, row_start, row_end)
+                while index != -1:
+                    end = chunk.find(0, index, row_end)
+                    end = row_end if end == -1 else end
+                    yield start_x + index - row_start, start_y + row, end - index
+                    index = chunk.find(1, end, row_end)
+
+    def to_chunks(self) -> tuple[list[tuple[int, int]], dict[tuple[int, int], bytes]]:
+        """
+        Get the keys of the chunks that are full, and the cells of the other chunks row by row,
+        with one byte per cell: 1 if the cell is in the set, 0 if not.
+        """
+        return list(self._full), {key: bytes(chunk) for key, chunk in self._chunks.items()}
+
+    @classmethod
+    def from_spans(cls, spans: Iterable[tuple[int, int, int]]) -> "FogChunks":
+        """Create a set of cells from the output of `spans`."""
+        fog = cls()
+        for x, y, length in spans:
+            fog.add_span(x, y, length)
+        return fog
+
+    @classmethod
+    def from_chunks(cls, full: Iterable[tuple[int, int]], chunks: dict[tuple[int, int], bytes]) -> "FogChunks":
+        """Create a set of cells from the output of `to_chunks`."""
+        fog = cls()
+        fog._full.update(full)
+        fog._size = len(fog._full) * CHUNK_AREA
+        for key, cells in chunks.items():
+            chunk = bytearray(cells)
+            cell_count = chunk.count(1)
+            if cell_count == CHUNK_AREA:
+                fog._full.add(key)
+            elif cell_count > 0:
+                fog._chunks[key] = chunk
+                fog._counts[key] = cell_count
+            fog._size += cell_count
+        return fog
+
+    def update(self, cells: Iterable[tuple[int, int]]) -> None:
+        for cell in cells:
+            self.add(cell)
+
+    def difference_update(self, cells: Iterable[tuple[int, int]]) -> None:
+        for cell in cells:
+            self.discard(cell)
+
+    def clear(self) -> None:
+        self._chunks.clear()
+        self._counts.clear()
+        self._full.clear()
+        self._size = 0
+        self.version = next(_VERSIONS)
+        # Any cell could have changed
+        self._changes.clear()
+        self._logged_since = self.version
+
+    def changed_area(self, version: int) -> tuple[int, int, int, int] | None:
+        """
+        Get the area of cells that have changed after the given version of this set, as (x, y, width, height),
+        or None if it's not known, because the version is older than the changes that are remembered.
+        """
+        if not self._logged_since <= version <= self.version:
+            return None
+
+        left = top = right = bottom = None
+        for change_version, x, y, length in reversed(self._changes):
+            if change_version <= version:
+                break
+            left = x if left is None else min(left, x)
+            right = x + length if right is None else max(right, x + length)
+            top = y if top is None else min(top, y)
+            bottom = y + 1 if bottom is None else max(bottom, y + 1)
+
+        if left is None:
+            return 0, 0, 0, 0
+        return left, top, right - left, bottom - top
+
+    def _log_change(self, x: int, y: int, length: int) -> None:
+        self.version = next(_VERSIONS)
+        if len(self._changes) == CHANGE_LOG_SIZE:
+            self._logged_since = self._changes.popleft()[0]
+        self._changes.append((self.version, x, y, length))
+
+    def region(self, start_x: int, start_y: int, width: int, height: int) -> bytearray:
+        """
+        Get the cells in the given area row by row, with one byte per cell:
+        1 if the cell is in the set, 0 if not.
+        """
+        result = bytearray(width * height)
+        end_x, end_y = start_x + width, start_y + height
+
+        for chunk_y in range(start_y >> CHUNK_SHIFT, ((end_y - 1) >> CHUNK_SHIFT) + 1):
+            for chunk_x in range(start_x >> CHUNK_SHIFT, ((end_x - 1) >> CHUNK_SHIFT) + 1):
+                key = chunk_x, chunk_y
+                chunk = self._chunks.get(key)
+                if chunk is None and key not in self._full:
+                    continue
+
+                low_x = max(start_x, chunk_x << CHUNK_SHIFT)
+                high_x = min(end_x, (chunk_x + 1) << CHUNK_SHIFT)
+                low_y = max(start_y, chunk_y << CHUNK_SHIFT)
+                high_y = min(end_y, (chunk_y + 1) << CHUNK_SHIFT)
+                length = high_x - low_x
+                full_row = b"\x01" * length
+
+                for y in range(low_y, high_y):
+                    dest = (y - start_y) * width + (low_x - start_x)
+                    if chunk is None:
+                        result[dest : dest + length] = full_row
+                    else:
+                        src = ((y & CHUNK_MASK) << CHUNK_SHIFT) | (low_x & CHUNK_MASK)
+                        result[dest : dest + length] = chunk[src : src + length]
+
+        return result
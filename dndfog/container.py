@@ -0,0 +1,204 @@
+import json
+import struct
+import sys
+import zipfile
+import zlib
+from array import array
+from collections.abc import Iterable
+from itertools import chain
+
+import pygame
+
+from dndfog.chunks import CHUNK_AREA, FogChunks
+from dndfog.map import encode_map_image, encoded_image
+from dndfog.types import BackgroundImage, EncodedImage, PieceData, PieceSize, ProgramState, SaveData, StrokeData
+
+CONTAINER_VERSION: int = 2
+"""Version of the save file format. Version 1 is the JSON format."""
+
+COMPRESS_LEVEL: int = 1
+"""Deflate level used for the files in the archive. Higher levels are much slower for little gain."""
+
+PREVIEW_SIZE: int = 256
+"""Largest width or height of the preview of the background map, which is shown while the map loads."""
+
+_CHUNK = struct.Struct("<ii")
+"""Position of a fog chunk. Followed by its cells, with one byte per cell."""
+_PIECE = struct.Struct("<iiBBBB")
+"""Top left cell, color and size of a piece."""
+_STROKE = struct.Struct("<IdBBB")
+"""
+Number of points, size and color of a stroke. Followed by the points as pairs of doubles,
+so that strokes are saved exactly as they are, and journaled erasing is replayed the same way.
+"""
+
+__all__ = [
+    "is_container",
+    "read_container",
+    "read_container_image",
+    "write_container",
+]
+
+
+def is_container(path: str) -> bool:
+    return zipfile.is_zipfile(path)
+
+
+def write_container(path: str, state: ProgramState) -> None:
+    """
+    Write a save file as a zip archive with a `meta.json` file for the settings of the map,
+    and the background map, fog, pieces and markings as raw pixels and packed little-endian arrays.
+    The background map is compressed separately, so that the compressed pixels can be reused between saves.
+    """
+    image = state.map.original_image
+    image_meta = None
+    if image is not None:
+        # The background map doesn't change after it's loaded, so these are only encoded on the first save
+        encoded = encode_map_image(state.map, "zlib", compress_image)
+        preview = encode_map_image(state.map, "preview", encode_preview)
+        image_meta = {
+            "size": image.get_size(),
+            "mode": "RGBA",
+            "zoom": state.map.image_size,
+            "preview_size": preview_size(image.get_size()),
+            "sha256": encoded.sha256,
+        }
+    meta = {
+        "version": CONTAINER_VERSION,
+        "show": state.show.to_json(),
+        "map": {
+            "gridsize": state.map.gridsize,
+            "camera": state.map.camera,
+            "image": image_meta,
+            "image_offset": state.map.image_offset,
+            "fog_color": state.map.fog_color,
+            "grid_color": state.map.grid_color,
+            "journal_seq": state.map.journal_seq,
+        },
+    }
+
+    with zipfile.ZipFile(path, "w", compression=zipfile.ZIP_DEFLATED, compresslevel=COMPRESS_LEVEL) as archive:
+        archive.writestr("meta.json", json.dumps(meta))
+        if image is not None:
+            archive.writestr("preview.rgba", preview.data)
+            archive.writestr("image.rgba.zlib", encoded.data, compress_type=zipfile.ZIP_STORED)
+        full, chunks = pack_fog(state.map.removed_fog)
+        archive.writestr("fog_full.bin", full)
+        archive.writestr("fog_chunks.bin", chunks)
+        archive.writestr("pieces.bin", pack_pieces(state))
+        archive.writestr("markings.bin", pack_markings(state))
+
+
+def read_container(path: str) -> tuple[SaveData, pygame.Surface | None]:
+    """
+    Read a save file, and return its data in the same form as JSON save files,
+    and a small preview of the background map. Read the background map itself with `read_container_image`.
+    """
+    with zipfile.ZipFile(path, "r") as archive:
+        meta = json.loads(archive.read("meta.json"))
+        if meta["version"] > CONTAINER_VERSION:
+            msg = "Save file is from a newer version."
+            raise RuntimeError(msg)
+
+        preview: pygame.Surface | None = None
+        image_data: BackgroundImage | None = meta["map"]["image"]
+        if image_data is not None:
+            preview = pygame.image.frombytes(archive.read("preview.rgba"), image_data["preview_size"], "RGBA")
+            preview = preview.convert_alpha()
+
+        meta["map"]["removed_fog"] = unpack_fog(archive.read("fog_full.bin"), archive.read("fog_chunks.bin"))
+        meta["map"]["pieces"] = unpack_pieces(archive.read("pieces.bin"))
+        meta["map"]["markings"] = unpack_markings(archive.read("markings.bin"))
+
+    return SaveData(show=meta["show"], map=meta["map"]), preview
+
+
+def read_container_image(path: str, image_data: BackgroundImage) -> tuple[pygame.Surface, dict[str, EncodedImage]]:
+    """Read the background map from a save file, and its encoding to reuse when saving it again."""
+    with zipfile.ZipFile(path, "r") as archive:
+        encoded = encoded_image(archive.read("image.rgba.zlib"))
+        preview = encoded_image(archive.read("preview.rgba"))
+    pixels = zlib.decompress(encoded.data)
+    image = pygame.image.frombytes(pixels, image_data["size"], image_data["mode"]).convert_alpha()
+    return image, {"zlib": encoded, "preview": preview}
+
+
+def compress_image(image: pygame.Surface) -> bytes:
+    return zlib.compress(pygame.image.tobytes(image, "RGBA"), COMPRESS_LEVEL)
+
+
+def encode_preview(image: pygame.Surface) -> bytes:
+    return pygame.image.tobytes(pygame.transform.smoothscale(image, preview_size(image.get_size())), "RGBA")
+
+
+def preview_size(size: tuple[int, int]) -> tuple[int, int]:
+    """Scale the size down to fit the preview size, keeping its aspect ratio."""
+    scale = min(PREVIEW_SIZE / size[0], PREVIEW_SIZE / size[1], 1)
+    return max(round(size[0] * scale), 1), max(round(size[1] * scale), 1)
+
+
+def pack_fog(fog: FogChunks) -> tuple[bytes, bytes]:
+    """
+    Pack the revealed cells as the positions of chunks where every cell is revealed,
+    and the cells of the other chunks. The cells compress well, since they are mostly runs of zeros or ones.
+    """
+    full, chunks = fog.to_chunks()
+    packed_chunks = b"".join(_CHUNK.pack(*key) + cells for key, cells in chunks.items())
+    return _pack_array("i", chain.from_iterable(full)), packed_chunks
+
+
+def unpack_fog(full: bytes, chunks: bytes) -> FogChunks:
+    keys = _unpack_array("i", full)
+    step = _CHUNK.size + CHUNK_AREA
+    cells = {
+        _CHUNK.unpack_from(chunks, offset): chunks[offset + _CHUNK.size : offset + step]
+        for offset in range(0, len(chunks), step)
+    }
+    return FogChunks.from_chunks(zip(keys[0::2], keys[1::2], strict=True), cells)
+
+
+def pack_pieces(state: ProgramState) -> bytes:
+    return b"".join(_PIECE.pack(*piece.place, *piece.color, piece.size.value) for piece in state.map.pieces)
+
+
+def unpack_pieces(data: bytes) -> list[PieceData]:
+    return [
+        PieceData(parent=(x, y), place=(x, y), color=(r, g, b), size=PieceSize(size), show=True)
+        for x, y, r, g, b, size in _PIECE.iter_unpack(data)
+    ]
+
+
+def pack_markings(state: ProgramState) -> bytes:
+    parts: list[bytes] = []
+    for stroke in state.map.markings.values():
+        parts.append(_STROKE.pack(len(stroke["points"]), stroke["size"], *stroke["color"]))
+        parts.append(_pack_array("d", chain.from_iterable(stroke["points"])))
+    return b"".join(parts)
+
+
+def unpack_markings(data: bytes) -> list[StrokeData]:
+    markings: list[StrokeData] = []
+    offset = 0
+    while offset < len(data):
+        length, size, r, g, b = _STROKE.unpack_from(data, offset)
+        offset += _STROKE.size
+        points = _unpack_array("d", data[offset : offset + length * 16])
+        offset += length * 16
+        markings.append(
+            StrokeData(points=list(zip(points[0::2], points[1::2], strict=True)), size=size, color=(r, g, b)),
+        )
+    return markings
+
+
+def _pack_array(typecode: str, values: Iterable[float]) -> bytes:
+    packed = array(typecode, values)
+    if sys.byteorder == "big":
+        packed.byteswap()
+    return packed.tobytes()
+
+
+def _unpack_array(typecode: str, data: bytes) -> array:
+    unpacked = array(typecode, data)
+    if sys.byteorder == "big":
+        unpacked.byteswap()
+    return unpacked
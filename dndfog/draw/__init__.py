@@ -1,26 +1,78 @@
+from collections.abc import Iterable
+
 import pygame
 
 from dndfog.draw.map import draw_fog, draw_grid, draw_map, draw_markings, draw_pieces
+from dndfog.draw.status import draw_message, draw_profiler, draw_saving_indicator
 from dndfog.draw.toolbar import draw_toolbar
+from dndfog.profiler import mark_stage
 from dndfog.types import LoopData, ProgramState
 
 
 def draw(display: pygame.Surface, loop: LoopData, state: ProgramState) -> None:
+    if state.redraw.full:
+        draw_layers(display, loop, state)
+        pygame.display.flip()
+        mark_stage("flip")
+
+    elif state.redraw.areas:
+        # Draw everything only inside the changed areas
+        areas = merge_overlapping_areas(area.clip(display.get_rect()) for area in state.redraw.areas)
+        for area in areas:
+            display.set_clip(area)
+            draw_layers(display, loop, state)
+        display.set_clip(None)
+        pygame.display.update(areas)
+        mark_stage("flip")
+
+    else:
+        state.redraw.skipped += 1
+
+    state.redraw.clear()
+
+
+def merge_overlapping_areas(areas: Iterable[pygame.Rect]) -> list[pygame.Rect]:
+    """Merge areas that overlap into one, so that no part of the screen is drawn twice. Empty areas are dropped."""
+    merged: list[pygame.Rect] = []
+    for area in areas:
+        if area.width <= 0 or area.height <= 0:
+            continue
+        # The merged area can overlap areas it didn't overlap before
+        result = area
+        index = result.collidelist(merged)
+        while index != -1:
+            result = result.union(merged.pop(index))
+            index = result.collidelist(merged)
+        merged.append(result)
+    return merged
+
+
+def draw_layers(display: pygame.Surface, loop: LoopData, state: ProgramState) -> None:
     # Fill background
     display.fill(state.map.fog_color)
 
     draw_map(display, state.map)
+    mark_stage("map")
 
     if state.show.grid:
         draw_grid(display, state.map)
+        mark_stage("grid")
 
     draw_pieces(display, state.map)
+    mark_stage("pieces")
 
     if state.show.fog:
         draw_fog(display, state.map)
+        mark_stage("fog")
 
     draw_markings(display, state.map)
+    mark_stage("markings")
 
     draw_toolbar(display, loop.mouse_pos, state)
+    mark_stage("toolbar")
+
+    draw_saving_indicator(display)
+    draw_message(display, state)
 
-    pygame.display.flip()
+    if state.show.profiler:
+        draw_profiler(display, state)
@@ -1,77 +1,293 @@
-import copy
+from functools import lru_cache
 
 import pygame
 
-from dndfog.camera import get_visible_area_limits
-from dndfog.grid import draw_position_on_grid
-from dndfog.types import Glow, MapData
+from dndfog.grid import bounds_on_grid, draw_position_on_grid
+from dndfog.map import clear_tile_cache, visible_map_tiles
+from dndfog.markings import strokes_in_bounds
+from dndfog.piece import pieces_in_bounds
+from dndfog.types import ColorTuple, MapData, StrokeData
+
+FOG_MASK_SCALE: int = 4
+"""Fog mask samples per grid cell in both directions, when the grid is big enough to show them."""
+
+PIECE_SPRITE_CACHE_SIZE: int = 256
+"""How many differently colored or sized piece sprites to keep in memory at most."""
+
+_FOG_ALPHA = bytes.maketrans(b"\x00\x01", b"\xff\x00")
+
+
+def clear_layer_caches(map_data: MapData) -> None:
+    """Forget everything cached for drawing the layers of the map, so that the next frame is drawn from scratch."""
+    clear_tile_cache()
+    grid_layer.cache_clear()
+    piece_sprite.cache_clear()
+    map_data.fog_layer.invalidate()
+    map_data.markings_layer.invalidate()
 
 
 def draw_map(display: pygame.Surface, map_data: MapData) -> None:
-    display.blit(
-        map_data.image,
-        draw_position_on_grid((0, 0), map_data.camera, map_data.gridsize, offset=map_data.image_offset),
-    )
+    if map_data.original_image is None:
+        return
+
+    position = draw_position_on_grid((0, 0), map_data.camera, map_data.gridsize, offset=map_data.image_offset)
+    display.blits(list(visible_map_tiles(map_data, position, display.get_clip())), doreturn=False)
 
 
 def draw_grid(display: pygame.Surface, map_data: MapData) -> None:
-    width, height = display.get_size()
+    layer = grid_layer(map_data.gridsize, map_data.grid_color, display.get_size())
+    display.blit(layer, (-(map_data.camera[0] % map_data.gridsize), -(map_data.camera[1] % map_data.gridsize)))
+
+
+@lru_cache(maxsize=2)
+def grid_layer(gridsize: int, grid_color: ColorTuple, display_size: tuple[int, int]) -> pygame.Surface:
+    """Grid lines for the whole display, with one extra cell in both directions for moving the camera."""
+    width, height = display_size[0] + gridsize, display_size[1] + gridsize
+    layer = pygame.Surface((width, height), flags=pygame.SRCALPHA)
 
-    start_x, start_y, end_x, end_y = get_visible_area_limits(display, map_data.camera, map_data.gridsize)
+    # Lines are two pixels wide, starting one pixel before the cell edge
+    for x in range(-1, width, gridsize):
+        pygame.draw.line(layer, grid_color, (x, 0), (x, height), 2)
 
-    for x in range(start_x, end_x, map_data.gridsize):
-        pygame.draw.line(display, map_data.grid_color, (x - map_data.camera[0], 0), (x - map_data.camera[0], height), 2)
+    for y in range(-1, height, gridsize):
+        pygame.draw.line(layer, grid_color, (0, y), (width, y), 2)
 
-    for y in range(start_y, end_y, map_data.gridsize):
-        pygame.draw.line(display, map_data.grid_color, (0, y - map_data.camera[1]), (width, y - map_data.camera[1]), 2)
+    return layer.convert_alpha()
 
 
 def draw_pieces(display: pygame.Surface, map_data: MapData) -> None:
-    for (x, y), piece_data in map_data.pieces.items():
-        if not piece_data["show"]:
-            continue
+    bounds = bounds_on_grid(display.get_clip(), map_data.camera, map_data.gridsize)
+    sprites: list[tuple[pygame.Surface, tuple[int, int]]] = []
+    for piece in pieces_in_bounds(map_data, bounds):
+        x, y = piece.place
+        size = int(piece.size)
+        center = draw_position_on_grid((x + (0.5 * size), y + (0.5 * size)), map_data.camera, map_data.gridsize)
+        sprite = piece_sprite(piece.color, size, map_data.gridsize)
+        offset = sprite.get_width() // 2
+        sprites.append((sprite, (center[0] - offset, center[1] - offset)))
 
-        color = piece_data["color"]
-        size = int(piece_data["size"])
-        pygame.draw.circle(
-            display,
-            color=color,
-            center=draw_position_on_grid((x + (0.5 * size), y + (0.5 * size)), map_data.camera, map_data.gridsize),
-            radius=(7 * (map_data.gridsize * size)) // 16,
-        )
+    display.blits(sprites, doreturn=False)
+
+
+@lru_cache(maxsize=PIECE_SPRITE_CACHE_SIZE)
+def piece_sprite(color: ColorTuple, size: int, gridsize: int) -> pygame.Surface:
+    """Circle for a piece of the given color and size, centered on the sprite."""
+    radius = (7 * (gridsize * size)) // 16
+    sprite = pygame.Surface((radius * 2 + 2, radius * 2 + 2), flags=pygame.SRCALPHA)
+    pygame.draw.circle(sprite, color=color, center=(radius + 1, radius + 1), radius=radius)
+    return sprite.convert_alpha()
 
 
 def draw_markings(display: pygame.Surface, map_data: MapData) -> None:
-    for (x, y), data in map_data.markings.items():
-        pygame.draw.circle(
-            display,
-            color=data["color"],
-            center=(x - map_data.camera[0], y - map_data.camera[1]),
-            radius=data["size"].value,
-        )
+    layer = update_markings_layer(map_data, display.get_size())
+    display.blit(layer, (0, 0))
+
+
+def update_markings_layer(map_data: MapData, size: tuple[int, int]) -> pygame.Surface:
+    """
+    Bring the retained markings layer up to date and return it.
+    Only new stroke segments and erased areas are drawn, unless the view has changed.
+    """
+    layer = map_data.markings_layer
+    camera, gridsize = map_data.camera, map_data.gridsize
+
+    resized = layer.surface is None or layer.surface.get_size() != size
+    if resized or (layer.camera, layer.gridsize) != (camera, gridsize):
+        if resized:
+            layer.surface = pygame.Surface(size, pygame.SRCALPHA)
+        layer.surface.fill((0, 0, 0, 0))
+        layer.camera, layer.gridsize = camera, gridsize
+        for stroke in strokes_in_bounds(map_data, bounds_on_grid(layer.surface.get_rect(), camera, gridsize)):
+            draw_stroke(layer.surface, stroke, camera, gridsize)
+
+    else:
+        for stroke, index in layer.segments:
+            draw_stroke_segment(layer.surface, stroke, index, camera, gridsize)
+
+        # Erased areas last, so that segments of strokes erased since are cleared again
+        for area in layer.damaged:
+            layer.surface.set_clip(area)
+            layer.surface.fill((0, 0, 0, 0))
+            for stroke in strokes_in_bounds(map_data, bounds_on_grid(area, camera, gridsize)):
+                draw_stroke(layer.surface, stroke, camera, gridsize)
+        layer.surface.set_clip(None)
+
+    layer.segments.clear()
+    layer.damaged.clear()
+    return layer.surface
+
+
+def draw_stroke(display: pygame.Surface, stroke: StrokeData, camera: tuple[int, int], gridsize: int) -> None:
+    radius = stroke_radius(stroke, gridsize)
+    points = [draw_position_on_grid(point, camera, gridsize) for point in stroke["points"]]
+
+    if len(points) > 1:
+        pygame.draw.lines(display, stroke["color"], False, points, radius * 2)  # noqa: FBT003
+
+    # Round caps and joins
+    for point in points:
+        pygame.draw.circle(display, stroke["color"], point, radius)
+
+
+def draw_stroke_segment(
+    display: pygame.Surface,
+    stroke: StrokeData,
+    index: int,
+    camera: tuple[int, int],
+    gridsize: int,
+) -> None:
+    """Draw the segment of the stroke that ends in the point at the given index."""
+    radius = stroke_radius(stroke, gridsize)
+    segment = stroke["points"][max(index - 1, 0) : index + 1]
+    points = [draw_position_on_grid(point, camera, gridsize) for point in segment]
+
+    if len(points) > 1:
+        pygame.draw.line(display, stroke["color"], points[0], points[1], radius * 2)
+
+    for point in points:
+        pygame.draw.circle(display, stroke["color"], point, radius)
+
+
+def stroke_radius(stroke: StrokeData, gridsize: int) -> int:
+    return max(round(stroke["size"] * gridsize), 1)
 
 
 def draw_fog(display: pygame.Surface, map_data: MapData) -> None:
-    start_x, start_y, end_x, end_y = get_visible_area_limits(display, map_data.camera, map_data.gridsize)
-    start_x, start_y, end_x, end_y = (
-        start_x // map_data.gridsize,
-        start_y // map_data.gridsize,
-        end_x // map_data.gridsize,
-        end_y // map_data.gridsize,
+    width, height = display.get_size()
+    gridsize = map_data.gridsize
+
+    # Include one extra cell on each side so that the soft edge continues outside the screen
+    start_x = map_data.camera[0] // gridsize - 1
+    start_y = map_data.camera[1] // gridsize - 1
+    columns = (map_data.camera[0] + width) // gridsize + 2 - start_x
+    rows = (map_data.camera[1] + height) // gridsize + 2 - start_y
+
+    layer = update_fog_layer(map_data, (start_x, start_y), (columns, rows))
+
+    # Mask samples are in the middle of their part of the cell
+    scale = fog_mask_scale(gridsize)
+    display.blit(
+        layer,
+        draw_position_on_grid((start_x, start_y), map_data.camera, gridsize, offset=(-0.5 / scale, -0.5 / scale)),
     )
 
-    inner_color = pygame.Color(*map_data.fog_color)
-    outer_color = copy.deepcopy(inner_color)
-    outer_color.a = 0
 
-    glow = Glow(
-        radius_range=range(map_data.gridsize, map_data.gridsize // 2, -1),
-        inner_color=inner_color,
-        outer_color=outer_color,
+def update_fog_layer(map_data: MapData, start: tuple[int, int], size: tuple[int, int]) -> pygame.Surface:
+    """
+    Get the fog layer for the given area of cells. The layer is kept between frames,
+    and only the cells that have changed since it was drawn are drawn again.
+    """
+    layer = map_data.fog_layer
+    fog = map_data.removed_fog
+    view = (start, size, map_data.gridsize, map_data.fog_color)
+
+    changed = None
+    if layer.surface is not None and layer.view == view and layer.fog is fog:
+        changed = fog.changed_area(layer.version)
+
+    # Patching most of the layer would be slower than drawing it again
+    if changed is None or changed[2] * changed[3] > size[0] * size[1] // 2:
+        layer.surface = build_fog_layer(map_data, start, size)
+    elif changed[2] > 0:
+        patch_fog_layer(layer.surface, map_data, start, size, changed)
+
+    layer.view, layer.fog, layer.version = view, fog, fog.version
+    return layer.surface
+
+
+def patch_fog_layer(
+    surface: pygame.Surface,
+    map_data: MapData,
+    start: tuple[int, int],
+    size: tuple[int, int],
+    changed: tuple[int, int, int, int],
+) -> None:
+    """Draw the fog of the given changed cells again on the fog layer for the given area of cells."""
+    x, y, width, height = changed
+    # The soft edge of the changed cells reaches into the cells next to them
+    left, top = max(x - 1, start[0]), max(y - 1, start[1])
+    right, bottom = min(x + width + 1, start[0] + size[0]), min(y + height + 1, start[1] + size[1])
+    if right <= left or bottom <= top:
+        return
+
+    # Build one more cell on each side, so that the soft edge of the patch matches the rest of the layer,
+    # except past the edges of the layer, where the layer doesn't have those cells either
+    patch_left, patch_top = max(left - 1, start[0]), max(top - 1, start[1])
+    patch_right, patch_bottom = min(right + 1, start[0] + size[0]), min(bottom + 1, start[1] + size[1])
+    patch = build_fog_layer(map_data, (patch_left, patch_top), (patch_right - patch_left, patch_bottom - patch_top))
+
+    gridsize = map_data.gridsize
+    area = pygame.Rect(
+        (left - start[0]) * gridsize,
+        (top - start[1]) * gridsize,
+        (right - left) * gridsize,
+        (bottom - top) * gridsize,
     )
+    source = pygame.Rect((left - patch_left) * gridsize, (top - patch_top) * gridsize, *area.size)
+    # Replace the pixels instead of blending the patch on top of them
+    surface.fill((0, 0, 0, 0), area)
+    surface.blit(patch, area, area=source, special_flags=pygame.BLEND_RGBA_ADD)
+
+
+def fog_mask_scale(gridsize: int) -> int:
+    return FOG_MASK_SCALE if gridsize >= 2 * FOG_MASK_SCALE else 1
+
+
+def build_fog_layer(map_data: MapData, start: tuple[int, int], size: tuple[int, int]) -> pygame.Surface:
+    """
+    Render fog for the given area of cells into a single surface.
+
+    Fog is first built as a small alpha mask with a few samples per cell, which is then
+    smoothly scaled up to the size of the area on the screen to give the fog its soft edge.
+    """
+    columns, rows = size
+    scale = fog_mask_scale(map_data.gridsize)
+    alpha = map_data.removed_fog.region(start[0], start[1], columns, rows).translate(_FOG_ALPHA)
+
+    # Smoothscale places the first and last sample on the edges of the scaled surface,
+    # so add one column and row of padding to have every cell be exactly gridsize wide.
+    mask_width = columns * scale + 1
+    mask = bytearray()
+    line = bytearray(mask_width)
+    for row in range(rows):
+        cells = alpha[row * columns : (row + 1) * columns]
+        line = bytearray(mask_width)
+        for i in range(scale):
+            line[i : columns * scale : scale] = cells
+        line[-1] = cells[-1]
+        mask += line * scale
+    mask += line
+
+    # Grow the fog by one sample, so that fogged cells are fully covered to their edges
+    # and the soft edge is drawn over the revealed cells next to them.
+    if scale > 1:
+        mask = _grow_mask(mask, mask_width)
+
+    red, green, blue = map_data.fog_color
+    pixels = bytearray(len(mask) * 4)
+    pixels[0::4] = bytes((red,)) * len(mask)
+    pixels[1::4] = bytes((green,)) * len(mask)
+    pixels[2::4] = bytes((blue,)) * len(mask)
+    pixels[3::4] = mask
+
+    surface = pygame.image.frombuffer(pixels, (mask_width, len(mask) // mask_width), "RGBA")
+    layer = pygame.transform.smoothscale(surface, (columns * map_data.gridsize, rows * map_data.gridsize))
+    return layer.convert_alpha()
+
+
+def _grow_mask(mask: bytearray, width: int) -> bytes:
+    """Grow the non-zero areas of a row-major mask by one sample in every direction."""
+    value = int.from_bytes(mask, "big")
+    # Samples don't grow past the ends of their row into the next or previous one
+    from_right, from_left = _row_end_masks(width, len(mask) // width)
+    value |= ((value << 8) & from_right) | ((value >> 8) & from_left)
+    value |= (value << 8 * width) | (value >> 8 * width)
+    return (value & ((1 << 8 * len(mask)) - 1)).to_bytes(len(mask), "big")
+
 
-    for x in range(start_x, end_x, 1):
-        for y in range(start_y, end_y, 1):
-            if (x, y) in map_data.removed_fog:
-                continue
-            display.blit(next(glow), draw_position_on_grid((x - 0.5, y - 0.5), map_data.camera, map_data.gridsize))
+@lru_cache(maxsize=8)
+def _row_end_masks(width: int, rows: int) -> tuple[int, int]:
+    """Masks for every sample of a row-major mask, except the last or the first one of each row."""
+    except_last = int.from_bytes((b"\xff" * (width - 1) + b"\x00") * rows, "big")
+    except_first = int.from_bytes((b"\x00" + b"\xff" * (width - 1)) * rows, "big")
+    return except_last, except_first
@@ -0,0 +1,73 @@
+import pygame
+
+from dndfog.draw.generic import draw_rect_transparent, draw_text_centered
+from dndfog.messages import message_area
+from dndfog.profiler import PROFILER_LINE_HEIGHT, profiler_area, stage_percentiles
+from dndfog.saving import is_saving, saving_indicator_area
+from dndfog.types import ProgramState, get_font
+
+
+def draw_saving_indicator(display: pygame.Surface) -> None:
+    if not is_saving():
+        return
+
+    area = saving_indicator_area(display.get_size())
+    draw_rect_transparent(
+        display,
+        dest=area.topleft,
+        size=area.size,
+        color=(111, 111, 111, 240),
+        rect=(0, 0, area.width, area.height),
+        border_radius=10,
+    )
+    draw_text_centered(display, "Saving...", area)
+
+
+def draw_message(display: pygame.Surface, state: ProgramState) -> None:
+    if state.message is None:
+        return
+
+    area = message_area(display.get_size())
+    draw_rect_transparent(
+        display,
+        dest=area.topleft,
+        size=area.size,
+        color=(120, 40, 40, 240),
+        rect=(0, 0, area.width, area.height),
+        border_radius=10,
+    )
+    draw_text_centered(display, state.message, area)
+
+
+def draw_profiler(display: pygame.Surface, state: ProgramState) -> None:
+    """
+    Draw the timings of the stages of the latest frames, how many things there are on the map,
+    and how many frames have been skipped or waited for events since there was nothing to do.
+    """
+    area = profiler_area(display.get_size())
+    draw_rect_transparent(
+        display,
+        dest=area.topleft,
+        size=area.size,
+        color=(40, 40, 40, 220),
+        rect=(0, 0, area.width, area.height),
+        border_radius=10,
+    )
+
+    rows = [("ms", "p50", "p95", "p99")]
+    rows += [(stage, *(f"{time:.2f}" for time in times)) for stage, times in stage_percentiles().items()]
+    columns = (area.left + 10, area.left + 110, area.left + 170, area.left + 230)
+    font = get_font()
+    for row, texts in enumerate(rows):
+        y = area.top + 5 + row * PROFILER_LINE_HEIGHT
+        for x, text in zip(columns, texts, strict=True):
+            display.blit(font.render(text, True, (222, 222, 222)), (x, y))  # noqa: FBT003
+
+    map_data = state.map
+    counts = [
+        f"fog {len(map_data.removed_fog)}  pieces {len(map_data.pieces)}  markings {len(map_data.markings)}",
+        f"skipped frames {state.redraw.skipped}  idle waits {state.redraw.idle}",
+    ]
+    for row, text in enumerate(counts, start=len(rows)):
+        y = area.top + 5 + row * PROFILER_LINE_HEIGHT
+        display.blit(font.render(text, True, (222, 222, 222)), (columns[0], y))  # noqa: FBT003
@@ -11,7 +11,7 @@ from dndfog.toolbar import (
     get_placing_found_circles,
     get_placing_single_circle,
 )
-from dndfog.types import FogSize, MarkerSize, PieceSize, PlacingKey, ProgramState, Tool
+from dndfog.types import FogShape, FogSize, MarkerSize, PieceSize, PlacingKey, ProgramState, Tool
 
 
 def draw_toolbar(display: pygame.Surface, mouse_pos: tuple[int, int], state: ProgramState) -> None:
@@ -37,7 +37,8 @@ def draw_toolbar(display: pygame.Surface, mouse_pos: tuple[int, int], state: Pro
 
     elif state.selected.tool == Tool.fog:
         offset = draw_fog_checkbox(display, mouse_pos, state.show.fog)
-        draw_fog_size_picker(display, mouse_pos, state.selected.fog, offset=offset)
+        offset = draw_fog_size_picker(display, mouse_pos, state.selected.fog, offset=offset)
+        draw_fog_shape_button(display, mouse_pos, state.selected.fog_shape, offset=offset)
 
     elif state.selected.tool == Tool.grid:
         draw_grid_checkbox(display, mouse_pos, state.show.grid)
@@ -105,7 +106,7 @@ def draw_fog_checkbox(
 def draw_fog_size_picker(
     display: pygame.Surface,
     mouse_pos: tuple[int, int],
-    selected_size: FogSize,
+    selected_size: int,
     offset: int = 0,
 ) -> int:
     offset = draw_text_centered(display, "size", rect=(offset, TOOLBAR_HEIGHT, TOOLBAR_HEIGHT, TOOLBAR_HEIGHT))
@@ -115,7 +116,28 @@ def draw_fog_size_picker(
         dist = distance_between_points(center, mouse_pos)
         color = (66, 66, 66) if fog_size == selected_size or dist < radius else (101, 101, 101)
         pygame.draw.circle(display, color, center, radius=radius)
-    return center[0] + radius
+    # Sizes other than the ones above can be scrolled to, so show the size as a number as well
+    offset = center[0] + radius
+    return draw_text_centered(
+        display, str(int(selected_size)), rect=(offset, TOOLBAR_HEIGHT, TOOLBAR_HEIGHT // 2, TOOLBAR_HEIGHT)
+    )
+
+
+def draw_fog_shape_button(
+    display: pygame.Surface,
+    mouse_pos: tuple[int, int],
+    selected_shape: FogShape,
+    offset: int = 0,
+) -> int:
+    offset = draw_text_centered(display, "shape", rect=(offset, TOOLBAR_HEIGHT, TOOLBAR_HEIGHT, TOOLBAR_HEIGHT))
+    center, radius = get_placing_single_circle(PlacingKey.fog_shape, offset=offset)
+    dist = distance_between_points(center, mouse_pos)
+    color = (66, 66, 66) if dist < radius else (101, 101, 101)
+    pygame.draw.circle(display, color, center, radius=radius)
+    offset = center[0] + radius
+    return draw_text_centered(
+        display, selected_shape.name, rect=(offset, TOOLBAR_HEIGHT, TOOLBAR_HEIGHT, TOOLBAR_HEIGHT)
+    )
 
 
 def draw_grid_checkbox(
@@ -1,15 +1,32 @@
+import os
 import sys
 from contextlib import suppress
 
 import pygame
 
 from dndfog.camera import move_camera, zoom_camera
-from dndfog.fog import add_fog, remove_fog
+from dndfog.fog import add_fog, fog_brush_cell, fog_stroke_area, fog_stroke_spans, remove_fog
 from dndfog.grid import grid_position
+from dndfog.journal import compact_journal, flush_journal, record_change
 from dndfog.map import move_map, zoom_map
-from dndfog.markings import add_markings, move_markings, remove_markings
-from dndfog.piece import add_piece, move_piece, remove_piece
-from dndfog.saving import get_default_filename, open_data_file, open_file_dialog, save_data_file, save_file_dialog
+from dndfog.markings import add_markings, clear_markings, eraser_bounds, last_segment_area, remove_markings
+from dndfog.messages import show_message
+from dndfog.piece import add_piece, move_piece, piece_area, remove_piece
+from dndfog.profiler import close_profiler, enable_profiling
+from dndfog.recording import stop_recording
+from dndfog.saving import (
+    MAP_LOADED,
+    SAVE_FINISHED,
+    finish_loading_map,
+    get_default_filename,
+    open_data_file,
+    open_file_dialog,
+    save_data_file,
+    save_file_dialog,
+    saving_indicator_area,
+    wait_for_saves,
+    zoom_loading_map,
+)
 from dndfog.toolbar import (
     TOOLBAR_HEIGHT,
     select_button,
@@ -17,13 +34,19 @@ from dndfog.toolbar import (
     select_indicator,
     select_size_tool,
     set_indicator,
+    toolbar_area,
 )
 from dndfog.types import (
     COLOR_MAP,
+    MAX_FOG_SIZE,
     Event,
+    FogShape,
+    FogSize,
+    FogSpan,
     KeyEvent,
     LoopData,
     MouseButtonEvent,
+    MouseMotionEvent,
     MouseWheelEvent,
     PlacingKey,
     ProgramState,
@@ -31,11 +54,33 @@ from dndfog.types import (
 )
 
 
-def handle_event(event: Event, loop: LoopData, state: ProgramState) -> None:  # noqa: C901
+def handle_event(event: Event, loop: LoopData, state: ProgramState) -> None:  # noqa: C901, PLR0912
+    if event.type == pygame.MOUSEMOTION and state.show.toolbar:
+        handle_toolbar_hover(event, loop, state)
+
     if event.type == pygame.QUIT:
+        flush_journal(state)
+        wait_for_saves()
+        close_profiler()
+        stop_recording()
         pygame.quit()
         sys.exit()
 
+    elif event.type in {pygame.VIDEORESIZE, pygame.VIDEOEXPOSE, pygame.WINDOWEXPOSED}:
+        state.redraw.everything()
+
+    elif event.type == MAP_LOADED:
+        finish_loading_map(state)
+        state.redraw.everything()
+
+    elif event.type == SAVE_FINISHED:
+        state.redraw.area(saving_indicator_area(pygame.display.get_window_size()))
+        # Keep the journal, since the changes in it weren't saved
+        if event.error is not None:
+            show_message(state, f"Saving {os.path.basename(event.file)} failed: {event.error}")
+        else:
+            compact_journal(event.file, event.journal_seq)
+
     elif event.type == pygame.KEYDOWN:
         handle_key_down(event, loop, state)
 
@@ -64,7 +109,7 @@ def handle_event(event: Event, loop: LoopData, state: ProgramState) -> None:  #
         handle_right_mouse_button_held(event, loop, state)
 
 
-def handle_key_down(event: KeyEvent, loop: LoopData, state: ProgramState) -> None:
+def handle_key_down(event: KeyEvent, loop: LoopData, state: ProgramState) -> None:  # noqa: C901
     # Save data
     if event.mod & pygame.KMOD_CTRL and event.key == pygame.K_s:
         if event.mod & pygame.KMOD_SHIFT or state.file is None:
@@ -84,6 +129,7 @@ def handle_key_down(event: KeyEvent, loop: LoopData, state: ProgramState) -> Non
                 save_data_file(state)
         else:
             save_data_file(state)
+        state.redraw.area(saving_indicator_area(pygame.display.get_window_size()))
 
     # Load data
     elif event.mod & pygame.KMOD_CTRL and event.key == pygame.K_o:
@@ -98,31 +144,46 @@ def handle_key_down(event: KeyEvent, loop: LoopData, state: ProgramState) -> Non
         if path:
             state.file = path
             open_data_file(state)
+            state.redraw.everything()
 
     # Hide/Show toolbar
     elif event.key == pygame.K_TAB:
         state.show.toolbar = not state.show.toolbar
+        state.redraw.everything()
 
     # Hide/Show grid
     elif event.key == pygame.K_F1:
         state.show.grid = not state.show.grid
+        state.redraw.everything()
 
     # Hide/Show fog
     elif event.key == pygame.K_F2:
         state.show.fog = not state.show.fog
+        state.redraw.everything()
+
+    # Hide/Show profiler
+    elif event.key == pygame.K_F3:
+        state.show.profiler = not state.show.profiler
+        enable_profiling(state.show.profiler)
+        state.redraw.everything()
 
     # Tool quickselect (1-9)
     elif (tool_index := event.key - pygame.K_1) in Tool.values():
         state.selected.tool = Tool(tool_index)
+        state.redraw.area(toolbar_area(pygame.display.get_window_size()[0]))
 
 
 def handle_mouse_wheel(event: MouseWheelEvent, loop: LoopData, state: ProgramState) -> None:
+    # Change fog brush size
+    if state.selected.tool == Tool.fog and loop.pressed_modifiers & pygame.KMOD_CTRL:
+        state.selected.fog = max(min(state.selected.fog + event.y, MAX_FOG_SIZE), 1)
+        state.redraw.area(toolbar_area(pygame.display.get_window_size()[0]))
+        return
+
     # Zoom map
     old_gridsize = state.map.gridsize
     if state.map.gridsize + event.y > 0:
         state.map.gridsize = state.map.gridsize + event.y
-        old_camera = state.map.camera
-
         state.map.camera = zoom_camera(
             camera=state.map.camera,
             mouse_position=loop.mouse_pos,
@@ -130,111 +191,208 @@ def handle_mouse_wheel(event: MouseWheelEvent, loop: LoopData, state: ProgramSta
             old_gridsize=old_gridsize,
         )
 
-        move_markings(old_camera, state)
-
         if state.selected.tool != Tool.grid:
-            state.map.image = zoom_map(
-                image=state.map.image,
-                original_image=state.map.original_image,
+            state.map.image_size = zoom_map(
+                image_size=state.map.image_size,
                 old_gridsize=old_gridsize,
                 new_gridsize=state.map.gridsize,
             )
+            zoom_loading_map(old_gridsize=old_gridsize, new_gridsize=state.map.gridsize)
 
+        state.redraw.everything()
 
-def handle_left_mouse_button_down(event: MouseButtonEvent, loop: LoopData, state: ProgramState) -> None:  # noqa: C901
+
+def handle_left_mouse_button_down(  # noqa: C901, PLR0912
+    event: MouseButtonEvent,
+    loop: LoopData,
+    state: ProgramState,
+) -> None:
     # Select a tool from the toolbar
     if state.show.toolbar and 0 <= loop.mouse_pos[1] < TOOLBAR_HEIGHT:
         item_clicked, _ = grid_position(loop.mouse_pos, (0, 0), TOOLBAR_HEIGHT)
         with suppress(ValueError):
             state.selected.tool = Tool(item_clicked)
+        state.redraw.area(toolbar_area(pygame.display.get_window_size()[0]))
 
     # Use an option from the toolbar
     elif state.show.toolbar and TOOLBAR_HEIGHT <= loop.mouse_pos[1] < TOOLBAR_HEIGHT * 2:
+        # Options can show or hide whole layers
+        state.redraw.everything()
+
         if state.selected.tool == Tool.piece:
             state.selected.piece_size = select_size_tool(loop.mouse_pos, state.selected.piece_size)
 
         elif state.selected.tool == Tool.fog:
             state.show.fog = select_checkbox(PlacingKey.fog_checkbox, loop.mouse_pos, state.show.fog)
-            state.selected.fog = select_size_tool(loop.mouse_pos, state.selected.fog)
+            state.selected.fog = select_size_tool(loop.mouse_pos, state.selected.fog, FogSize)
+            if select_button(PlacingKey.fog_shape, loop.mouse_pos):
+                state.selected.fog_shape = FogShape((state.selected.fog_shape + 1) % len(FogShape))
 
         elif state.selected.tool == Tool.grid:
             state.show.grid = select_checkbox(PlacingKey.grid_checkbox, loop.mouse_pos, state.show.grid)
 
         elif state.selected.tool == Tool.mark:
             if select_button(PlacingKey.clear_markings, loop.mouse_pos):
-                state.map.markings = {}
+                clear_markings(state)
+                record_change(state, "clear_markings")
             state.selected.marker_size = select_size_tool(loop.mouse_pos, state.selected.marker_size)
             if select_indicator(PlacingKey.marker_color, loop.mouse_pos):
                 state.selected.indicator = PlacingKey.marker_color
 
     # Move piece
     elif state.selected.tool == Tool.piece:
-        if loop.grid_pos in state.map.pieces:
+        if loop.grid_pos in state.map.occupancy:
             state.selected.piece = loop.grid_pos
 
     # Add fog
     elif state.selected.tool == Tool.fog:
-        add_fog(state.map.removed_fog, loop.mouse_pos, state.map.camera, state.map.gridsize, state.selected.fog)
+        state.selected.fog_cell = None
+        add_fog_under_mouse(loop, state)
 
     # Add markings
     elif state.selected.tool == Tool.mark:
-        add_markings(loop.mouse_pos, state)
+        make_marking(loop, state)
 
 
 def handle_right_mouse_button_down(event: MouseButtonEvent, loop: LoopData, state: ProgramState) -> None:
     # Add or remove piece
     if state.selected.tool == Tool.piece:
-        if loop.grid_pos in state.map.pieces:
-            remove_piece(loop.grid_pos, state.map.pieces, state.colors)
+        if loop.grid_pos in state.map.occupancy:
+            piece = remove_piece(loop.grid_pos, state.map, state.colors)
+            record_change(state, "remove_piece", place=piece.place)
         else:
-            add_piece(loop.grid_pos, state.map.pieces, state.colors, state.selected.piece_size)
+            piece = add_piece(loop.grid_pos, state.map, state.colors, state.selected.piece_size)
+            if piece is not None:
+                record_change(state, "add_piece", place=piece.place, color=piece.color, size=piece.size.value)
+        if piece is not None:
+            state.redraw.area(piece_area(piece, state.map.camera, state.map.gridsize))
 
     # Remove fog
     elif state.selected.tool == Tool.fog:
-        remove_fog(state.map.removed_fog, loop.mouse_pos, state.map.camera, state.map.gridsize, state.selected.fog)
+        state.selected.fog_cell = None
+        remove_fog_under_mouse(loop, state)
 
     # Remove markings
     elif state.selected.tool == Tool.mark:
-        remove_markings(loop.mouse_pos, state)
+        erase_marking(loop, state)
 
 
 def handle_left_mouse_button_up(event: MouseButtonEvent, loop: LoopData, state: ProgramState) -> None:
+    if state.map.stroke is not None and state.map.stroke in state.map.markings:
+        stroke = state.map.markings[state.map.stroke]
+        record_change(state, "stroke", points=stroke["points"], size=stroke["size"], color=stroke["color"])
+
     state.selected.piece = None
-    state.map.last_marking = None
+    state.map.stroke = None
     state.selected.indicator = None
+    state.selected.fog_cell = None
 
 
 def handle_right_mouse_button_up(event: MouseButtonEvent, loop: LoopData, state: ProgramState) -> None:
-    pass
+    state.selected.fog_cell = None
 
 
 def handle_hold_left_mouse_button(event: MouseButtonEvent, loop: LoopData, state: ProgramState) -> None:
     if state.selected.tool == Tool.piece:
         if state.selected.piece is not None:
-            state.selected.piece = move_piece(state.selected.piece, loop.grid_pos, state.map.pieces)
+            piece = state.map.occupancy[state.selected.piece]
+            place = piece.place
+            state.redraw.area(piece_area(piece, state.map.camera, state.map.gridsize))
+            state.selected.piece = move_piece(state.selected.piece, loop.grid_pos, state.map)
+            state.redraw.area(piece_area(piece, state.map.camera, state.map.gridsize))
+            if piece.place != place:
+                record_change(state, "move_piece", place=place, to=piece.place)
 
     elif state.selected.tool == Tool.fog:
-        add_fog(state.map.removed_fog, loop.mouse_pos, state.map.camera, state.map.gridsize, state.selected.fog)
+        add_fog_under_mouse(loop, state)
 
     elif state.selected.tool == Tool.map:
         state.map.image_offset = move_map(state.map.image_offset, state.map.gridsize, loop.mouse_speed)
+        state.redraw.everything()
 
     elif state.selected.tool == Tool.mark:
-        if state.map.last_marking is not None:  # don't pass any possible hold events after mouse up
-            add_markings(loop.mouse_pos, state)
+        if state.map.stroke is not None:  # don't pass any possible hold events after mouse up
+            make_marking(loop, state)
         elif state.selected.indicator == PlacingKey.marker_color:
             pos = set_indicator(PlacingKey.marker_color, loop.mouse_pos[0])
             state.selected.marker_color = COLOR_MAP[pos]
+            state.redraw.area(toolbar_area(pygame.display.get_window_size()[0]))
 
 
 def handle_middle_mouse_button_held(event: MouseButtonEvent, loop: LoopData, state: ProgramState) -> None:
     # Move camera
     state.map.camera = move_camera(state.map.camera, loop.mouse_speed)
+    state.redraw.everything()
 
 
 def handle_right_mouse_button_held(event: MouseButtonEvent, loop: LoopData, state: ProgramState) -> None:
     if state.selected.tool == Tool.fog:
-        remove_fog(state.map.removed_fog, loop.mouse_pos, state.map.camera, state.map.gridsize, state.selected.fog)
+        remove_fog_under_mouse(loop, state)
 
     elif state.selected.tool == Tool.mark:
-        remove_markings(loop.mouse_pos, state)
+        erase_marking(loop, state)
+
+
+def handle_toolbar_hover(event: MouseMotionEvent, loop: LoopData, state: ProgramState) -> None:
+    # Redraw the toolbar when the mouse moves over it, or leaves it
+    area = toolbar_area(pygame.display.get_window_size()[0])
+    previous_pos = event.pos[0] - event.rel[0], event.pos[1] - event.rel[1]
+    if area.collidepoint(event.pos) or area.collidepoint(previous_pos):
+        state.redraw.area(area)
+
+
+def make_marking(loop: LoopData, state: ProgramState) -> None:
+    add_markings(loop.mouse_pos, state)
+    stroke = state.map.markings[state.map.stroke]
+    state.redraw.area(last_segment_area(stroke, state.map.camera, state.map.gridsize))
+
+
+def erase_marking(loop: LoopData, state: ProgramState) -> None:
+    bounds = eraser_bounds(loop.mouse_pos, state)
+    area = remove_markings(bounds, state)
+    if area is not None:
+        state.redraw.area(area)
+        record_change(state, "erase", bounds=bounds)
+
+
+def add_fog_under_mouse(loop: LoopData, state: ProgramState) -> None:
+    spans = fog_under_mouse(loop, state)
+    if spans:
+        add_fog(state.map.removed_fog, spans)
+        record_change(state, "add_fog", spans=spans)
+
+
+def remove_fog_under_mouse(loop: LoopData, state: ProgramState) -> None:
+    spans = fog_under_mouse(loop, state)
+    if spans:
+        remove_fog(state.map.removed_fog, spans)
+        record_change(state, "remove_fog", spans=spans)
+
+
+def fog_under_mouse(loop: LoopData, state: ProgramState) -> list[FogSpan]:
+    """Rows of cells the fog brush has moved over since fog was last added or removed while dragging."""
+    cell = fog_brush_cell(loop.mouse_pos, state.map.camera, state.map.gridsize, state.selected.fog)
+    if cell == state.selected.fog_cell:
+        return []
+
+    previous = state.selected.fog_cell
+    state.selected.fog_cell = cell
+    state.redraw.area(fog_stroke_area(previous, cell, state.map.camera, state.map.gridsize, state.selected.fog))
+    return fog_stroke_spans(previous, cell, state.selected.fog, state.selected.fog_shape)
+
+
+def coalesce_mouse_motion(events: list[Event]) -> list[Event]:
+    """
+    Combine the mouse motion events of a frame into one, in place of the last one, since moving the mouse
+    is handled based on where it is on the frame. Things that follow the mouse then only move once per frame.
+    """
+    motions = [event for event in events if event.type == pygame.MOUSEMOTION]
+    if len(motions) <= 1:
+        return events
+
+    last = motions[-1]
+    rel = sum(event.rel[0] for event in motions), sum(event.rel[1] for event in motions)
+    combined = pygame.event.Event(pygame.MOUSEMOTION, {**last.dict, "rel": rel})
+    return [
+        combined if event is last else event for event in events if event.type != pygame.MOUSEMOTION or event is last
+    ]
@@ -1,34 +1,98 @@
-from dndfog.grid import grid_position
-from dndfog.types import FogSize
+from collections.abc import Iterable
+from functools import lru_cache
+from math import sqrt
 
+import pygame
 
-def add_fog(
-    removed_fog: set[tuple[int, int]],
+from dndfog.chunks import FogChunks
+from dndfog.grid import area_on_screen, grid_position
+from dndfog.markings import interpolate_line
+from dndfog.types import FogShape, FogSpan
+
+
+def add_fog(removed_fog: FogChunks, spans: Iterable[FogSpan]) -> None:
+    for x, y, length in spans:
+        removed_fog.discard_span(x, y, length)
+
+
+def remove_fog(removed_fog: FogChunks, spans: Iterable[FogSpan]) -> None:
+    for x, y, length in spans:
+        removed_fog.add_span(x, y, length)
+
+
+def fog_brush_cell(
     mouse_pos: tuple[int, int],
     camera: tuple[int, int],
     gridsize: int,
-    selected_fog: FogSize,
-) -> None:
-    start_x = mouse_pos[0] - (gridsize // 2 * (selected_fog.value - 1))
-    start_y = mouse_pos[1] - (gridsize // 2 * (selected_fog.value - 1))
+    size: int,
+) -> tuple[int, int]:
+    """Top left cell under the fog brush at the given mouse position."""
+    start_x = mouse_pos[0] - gridsize * (size - 1) // 2
+    start_y = mouse_pos[1] - gridsize * (size - 1) // 2
+    return grid_position((start_x, start_y), camera, gridsize)
 
-    for x in range(selected_fog.value):
-        for y in range(selected_fog.value):
-            pos = grid_position((start_x + (x * gridsize), start_y + (y * gridsize)), camera, gridsize)
-            removed_fog.discard(pos)
 
+@lru_cache(maxsize=32)
+def fog_brush_spans(size: int, shape: FogShape) -> tuple[FogSpan, ...]:
+    """Rows of cells covered by the fog brush, relative to its top left cell."""
+    if shape == FogShape.line:
+        return ((0, (size - 1) // 2, size),)
 
-def remove_fog(
-    removed_fog: set[tuple[int, int]],
-    mouse_pos: tuple[int, int],
+    if shape == FogShape.circle:
+        spans: list[FogSpan] = []
+        radius = size / 2
+        for y in range(size):
+            # Half of the width of the circle at the middle of the row
+            half = sqrt(max(radius**2 - (y + 0.5 - radius) ** 2, 0))
+            left, right = round(radius - half), round(radius + half)
+            if right > left:
+                spans.append((left, y, right - left))
+        return tuple(spans)
+
+    return tuple((0, y, size) for y in range(size))
+
+
+def fog_stroke_spans(
+    start: tuple[int, int] | None,
+    end: tuple[int, int],
+    size: int,
+    shape: FogShape,
+) -> list[FogSpan]:
+    """
+    Rows of cells under the fog brush when it's moved in a straight line between the given top left cells,
+    so that fast movements don't leave gaps. Only the cells at the end if there is no start.
+    Overlapping rows are merged, so that every cell is in one row at most.
+    """
+    brush = fog_brush_spans(size, shape)
+    rows: dict[int, list[tuple[int, int]]] = {}
+    for x, y in interpolate_line(end, start):
+        for left, row, length in brush:
+            rows.setdefault(y + row, []).append((x + left, x + left + length))
+
+    spans: list[FogSpan] = []
+    for y, ranges in rows.items():
+        ranges.sort()
+        current_left, current_right = ranges[0]
+        for left, right in ranges[1:]:
+            if left > current_right:
+                spans.append((current_left, y, current_right - current_left))
+                current_left = left
+            current_right = max(current_right, right)
+        spans.append((current_left, y, current_right - current_left))
+    return spans
+
+
+def fog_stroke_area(
+    start: tuple[int, int] | None,
+    end: tuple[int, int],
     camera: tuple[int, int],
     gridsize: int,
-    selected_fog: FogSize,
-) -> None:
-    start_x = mouse_pos[0] - (gridsize // 2 * (selected_fog.value - 1))
-    start_y = mouse_pos[1] - (gridsize // 2 * (selected_fog.value - 1))
-
-    for x in range(selected_fog.value):
-        for y in range(selected_fog.value):
-            pos = grid_position((start_x + (x * gridsize), start_y + (y * gridsize)), camera, gridsize)
-            removed_fog.add(pos)
+    size: int,
+) -> pygame.Rect:
+    """Area of the screen that can change when the fog brush is moved between the given top left cells."""
+    start = start if start is not None else end
+    left, top = min(start[0], end[0]), min(start[1], end[1])
+    width = abs(start[0] - end[0]) + size
+    height = abs(start[1] - end[1]) + size
+    # The fog's soft edge extends to the next cell
+    return area_on_screen((left - 1, top - 1), (width + 2, height + 2), camera, gridsize)
@@ -3,29 +3,52 @@ import os
 import pygame
 
 from dndfog.draw import draw
-from dndfog.event_handlers import handle_event
+from dndfog.event_handlers import coalesce_mouse_motion, handle_event
 from dndfog.grid import grid_position
-from dndfog.saving import load_map
+from dndfog.journal import checkpoint_due, flush_journal
+from dndfog.messages import expire_message
+from dndfog.profiler import end_profiled_frame, mark_stage, profiler_area, start_profiled_frame
+from dndfog.recording import record_frame, start_recording
+from dndfog.saving import is_loading_map, load_map, save_data_file, saving_indicator_area
+from dndfog.startup import mark_startup, report_startup
 from dndfog.types import LoopData, ProgramState
 
+IDLE_TIMEOUT: int = 1000
+"""Milliseconds to wait for new events when there is nothing to draw."""
 
-def run(map_file: str) -> None:
+
+def run(map_file: str, frame_rate: int = 60, record: str | None = None) -> None:
     # Init
     pygame.init()
+    mark_startup("pygame init")
     os.environ["SDL_VIDEO_CENTERED"] = "1"
     pygame.display.set_caption("DND fog")
     clock = pygame.time.Clock()
-    frame_rate: int = 60
 
     # Screen setup
     display_size = (1200, 800)
     flags = pygame.SRCALPHA | pygame.RESIZABLE  # | pygame.NOFRAME
     display = pygame.display.set_mode(display_size, flags=flags)
+    mark_startup("window")
+
+    if record is not None:
+        start_recording(record, map_file, display_size)
 
     state = ProgramState()
     load_map(map_file, state)
+    mark_startup("open file")
 
     while True:
+        events = pygame.event.get()
+
+        # Nothing is happening, so wait for the next event instead of looping
+        if not events and not state.redraw.pending and not any(pygame.mouse.get_pressed()):
+            state.redraw.idle += 1
+            event = pygame.event.wait(IDLE_TIMEOUT)
+            if event.type != pygame.NOEVENT:
+                events = [event, *pygame.event.get()]
+
+        start_profiled_frame()
         mouse_pos = pygame.mouse.get_pos()
         loop = LoopData(
             mouse_pos=mouse_pos,
@@ -35,8 +58,26 @@ def run(map_file: str) -> None:
             pressed_buttons=pygame.mouse.get_pressed(),
         )
 
-        for event in pygame.event.get():
+        record_frame(loop, events)
+        for event in coalesce_mouse_motion(events):
             handle_event(event, loop, state)
 
+        flush_journal(state)
+        expire_message(state)
+        if checkpoint_due(state):
+            save_data_file(state, autosave=True)
+            state.redraw.area(saving_indicator_area(display.get_size()))
+        mark_stage("events")
+
+        # Show the latest timings whenever something is drawn
+        if state.show.profiler and state.redraw.pending:
+            state.redraw.area(profiler_area(display.get_size()))
+
         draw(display, loop, state)
+        end_profiled_frame(skipped=state.redraw.skipped, idle=state.redraw.idle)
+        mark_startup("first frame")
+        if not is_loading_map():
+            mark_startup("background map")
+            report_startup()
+
         clock.tick(frame_rate)
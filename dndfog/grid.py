@@ -1,3 +1,5 @@
+import pygame
+
 from dndfog.math import approx
 
 
@@ -13,9 +15,38 @@ def draw_position_on_grid(
     )
 
 
+def position_on_grid(
+    position: tuple[int, int],
+    camera: tuple[int, int],
+    gridsize: int,
+) -> tuple[float, float]:
+    """Exact position on the grid for a position on the screen, in grid cells."""
+    return (position[0] + camera[0]) / gridsize, (position[1] + camera[1]) / gridsize
+
+
 def grid_position(
     position: tuple[int, int],
     camera: tuple[int, int],
     gridsize: int,
 ) -> tuple[int, int]:
     return approx((position[0] + camera[0]) / gridsize), approx((position[1] + camera[1]) / gridsize)
+
+
+def area_on_screen(
+    position: tuple[float, float],
+    size: tuple[float, float],
+    camera: tuple[int, int],
+    gridsize: int,
+) -> pygame.Rect:
+    """Area of the screen covered by the given amount of grid cells, starting from the given grid position."""
+    left, top = draw_position_on_grid(position, camera, gridsize)
+    return pygame.Rect(left, top, int(size[0] * gridsize) + 1, int(size[1] * gridsize) + 1)
+
+
+def bounds_on_grid(
+    area: pygame.Rect,
+    camera: tuple[int, int],
+    gridsize: int,
+) -> tuple[float, float, float, float]:
+    """Bounds (left, top, right, bottom) of the given area of the screen on the grid, in grid cells."""
+    return (*position_on_grid(area.topleft, camera, gridsize), *position_on_grid(area.bottomright, camera, gridsize))
@@ -0,0 +1,245 @@
+import json
+import os
+import tempfile
+import time
+from contextlib import suppress
+from typing import Any, TextIO, TypeAlias
+
+from dndfog.fog import add_fog, remove_fog
+from dndfog.markings import add_stroke, clear_markings, remove_markings
+from dndfog.messages import show_message
+from dndfog.piece import move_piece, place_piece, remove_piece
+from dndfog.types import FogSpan, Piece, PieceSize, ProgramState, StrokeData
+
+CHECKPOINT_CHANGES: int = 500
+"""How many changes to journal before saving the whole map as a checkpoint."""
+
+CHECKPOINT_INTERVAL: float = 60
+"""Seconds after the first change since the last checkpoint, before saving the whole map as a checkpoint."""
+
+VIEW_INTERVAL: float = 1
+"""Seconds between journaling changes to the camera position and zoom level."""
+
+Change: TypeAlias = dict[str, Any]
+
+__all__ = [
+    "checkpoint_due",
+    "compact_journal",
+    "flush_journal",
+    "journal_path",
+    "mark_checkpoint",
+    "record_change",
+    "replay_journal",
+]
+
+
+class Journal:
+    """
+    Append-only file of the changes made to a map since it was last saved, with one JSON object per line.
+
+    Changes are numbered, and save files store the number of the last change they include,
+    so that the map can be brought up to date after a crash by replaying the changes after it.
+    """
+
+    def __init__(self) -> None:
+        self._file: TextIO | None = None
+        self._path: str | None = None
+        self._buffer: list[str] = []
+        self._view: tuple[Any, ...] | None = None
+        self._view_time: float = 0
+        self.unsaved: int = 0
+        """Changes since the last checkpoint."""
+        self.unsaved_since: float | None = None
+        """When the first change since the last checkpoint was made."""
+        self.disabled: bool = False
+        """Journaling is turned off for the rest of the session if the journal file can't be written."""
+
+    def record(self, state: ProgramState, change: Change) -> None:
+        if state.file is None or self.disabled:
+            return
+
+        state.map.journal_seq += 1
+        self._buffer.append(json.dumps({"seq": state.map.journal_seq, **change}))
+        self.unsaved += 1
+        if self.unsaved_since is None:
+            self.unsaved_since = time.monotonic()
+
+    def record_view(self, state: ProgramState) -> None:
+        """Journal the camera position and zoom level if they have changed, but only every so often."""
+        view = (state.map.camera, state.map.gridsize, state.map.image_size, state.map.image_offset)
+        if self._view is None:
+            self._view = view
+            return
+        if view == self._view or time.monotonic() - self._view_time < VIEW_INTERVAL:
+            return
+
+        self._view = view
+        self._view_time = time.monotonic()
+        camera, gridsize, image_size, image_offset = view
+        change = {"op": "view", "camera": camera, "gridsize": gridsize, "zoom": image_size, "offset": image_offset}
+        self.record(state, change)
+
+    def flush(self, state: ProgramState) -> None:
+        if not self._buffer or state.file is None:
+            return
+
+        path = journal_path(state.file)
+        try:
+            if self._path != path:
+                self.close()
+                self._path = path
+                self._file = open(path, "a")  # noqa: SIM115
+
+            self._file.write("\n".join(self._buffer) + "\n")
+            self._file.flush()
+        except OSError as error:
+            # For example, the map is in a folder that can't be written to
+            self.disable()
+            show_message(state, f"Changes can't be recovered after a crash: {error.strerror or error}")
+        self._buffer.clear()
+
+    def disable(self) -> None:
+        with suppress(OSError):
+            self.close()
+        self._buffer.clear()
+        self.disabled = True
+        self.unsaved = 0
+        self.unsaved_since = None
+
+    def reset(self) -> None:
+        """Start journaling a newly loaded map."""
+        self.close()
+        self._buffer.clear()
+        self._view = None
+        self.unsaved = 0
+        self.unsaved_since = None
+
+    def close(self) -> None:
+        file, self._file, self._path = self._file, None, None
+        if file is not None:
+            file.close()
+
+    def compact(self, file: str, seq: int) -> None:
+        """Remove the changes that are included in the save file, since they won't need to be replayed."""
+        path = journal_path(file)
+        if self._path == path:
+            self.close()
+
+        with suppress(FileNotFoundError):
+            lines = [line for line, change in read_changes(path) if change["seq"] > seq]
+            if not lines:
+                os.remove(path)
+                return
+
+            fd, temp_file = tempfile.mkstemp(dir=os.path.dirname(os.path.abspath(path)), suffix=".tmp")
+            with os.fdopen(fd, "w") as f:
+                f.writelines(lines)
+            os.replace(temp_file, path)
+
+
+_JOURNAL = Journal()
+
+
+def journal_path(file: str) -> str:
+    return f"{file}.journal"
+
+
+def record_change(state: ProgramState, op: str, **fields: Any) -> None:
+    """Journal a change made to the map. Written to the journal file on the next flush."""
+    _JOURNAL.record(state, {"op": op, **fields})
+
+
+def flush_journal(state: ProgramState) -> None:
+    _JOURNAL.record_view(state)
+    _JOURNAL.flush(state)
+
+
+def checkpoint_due(state: ProgramState) -> bool:
+    """Should the whole map be saved, so that the journal doesn't grow too long?"""
+    # Strokes are journaled when they are finished, so they can't be saved half drawn
+    if state.file is None or state.map.stroke is not None or _JOURNAL.unsaved == 0:
+        return False
+    return _JOURNAL.unsaved >= CHECKPOINT_CHANGES or time.monotonic() - _JOURNAL.unsaved_since >= CHECKPOINT_INTERVAL
+
+
+def mark_checkpoint() -> None:
+    """The whole map is being saved, so journaled changes up to now no longer count towards the next checkpoint."""
+    _JOURNAL.unsaved = 0
+    _JOURNAL.unsaved_since = None
+
+
+def compact_journal(file: str, seq: int) -> None:
+    _JOURNAL.compact(file, seq)
+
+
+def read_changes(path: str) -> list[tuple[str, Change]]:
+    """Read the lines of the journal file, and the changes in them. Stops at the first incomplete line."""
+    changes: list[tuple[str, Change]] = []
+    with open(path, "r") as f:
+        for line in f:
+            try:
+                changes.append((line, json.loads(line)))
+            except json.JSONDecodeError:
+                break
+    return changes
+
+
+def replay_journal(state: ProgramState) -> None:
+    """Apply the journaled changes that are not yet included in the loaded save file."""
+    changes: list[tuple[str, Change]] = []
+    try:
+        changes = read_changes(journal_path(state.file))
+    except FileNotFoundError:
+        pass
+    except OSError as error:
+        show_message(state, f"Changes after the last save can't be recovered: {error.strerror or error}")
+
+    for _, change in changes:
+        if change["seq"] > state.map.journal_seq:
+            apply_change(state, change)
+            state.map.journal_seq = change["seq"]
+
+    _JOURNAL.reset()
+
+
+def apply_change(state: ProgramState, change: Change) -> None:
+    op = change["op"]
+
+    if op == "add_fog":
+        add_fog(state.map.removed_fog, fog_change_spans(change))
+
+    elif op == "remove_fog":
+        remove_fog(state.map.removed_fog, fog_change_spans(change))
+
+    elif op == "add_piece":
+        piece = Piece(place=tuple(change["place"]), color=tuple(change["color"]), size=PieceSize(change["size"]))
+        place_piece(piece, state.map)
+
+    elif op == "remove_piece":
+        remove_piece(tuple(change["place"]), state.map, state.colors)
+
+    elif op == "move_piece":
+        move_piece(tuple(change["place"]), tuple(change["to"]), state.map)
+
+    elif op == "stroke":
+        points = [tuple(point) for point in change["points"]]
+        add_stroke(StrokeData(points=points, size=change["size"], color=tuple(change["color"])), state)
+
+    elif op == "erase":
+        remove_markings(tuple(change["bounds"]), state)
+
+    elif op == "clear_markings":
+        clear_markings(state)
+
+    elif op == "view":
+        state.map.camera = tuple(change["camera"])
+        state.map.gridsize = change["gridsize"]
+        state.map.image_size = tuple(change["zoom"])
+        state.map.image_offset = tuple(change["offset"])
+
+
+def fog_change_spans(change: Change) -> list[FogSpan]:
+    """Rows of cells changed by a fog change. Older journals have the cells instead of rows of them."""
+    if "spans" in change:
+        return [tuple(span) for span in change["spans"]]
+    return [(x, y, 1) for x, y in change["cells"]]
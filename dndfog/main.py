@@ -1,16 +1,49 @@
 from argparse import ArgumentParser, Namespace
 
-from dndfog.gameloop import run
-from dndfog.saving import open_file_dialog
+from dndfog.startup import mark_startup, start_startup_timer
 
 
 def start() -> None:
     parser = ArgumentParser()
     parser.add_argument("file", default=None, help="The file to load")
+    parser.add_argument("--fps", type=int, default=60, help="Maximum frame rate while the map is being used")
+    parser.add_argument(
+        "--profile-startup",
+        action="store_true",
+        help="Print how long each phase of starting the program takes",
+    )
+    parser.add_argument(
+        "--profile-csv",
+        default=None,
+        help="File to write the timings of each frame to, while the profiler is shown with F3",
+    )
+    parser.add_argument("--record", default=None, help="File to record the session to, so that it can be replayed")
+    parser.add_argument(
+        "--replay",
+        default=None,
+        help="Replay a recorded session on the given map without showing it, and print how long it took",
+    )
     try:
         args = parser.parse_args()
     except AttributeError:  # exe opened without args
-        args = Namespace(file=None)
+        args = Namespace(file=None, fps=60, profile_startup=False, profile_csv=None, record=None, replay=None)
+
+    if args.replay is not None:
+        from dndfog.replay import replay_session
+
+        replay_session(str(args.file), args.replay)
+        return
+
+    if args.profile_startup:
+        start_startup_timer()
+
+    # Imported here, so that startup can be timed from the start
+    from dndfog.gameloop import run
+    from dndfog.profiler import set_profiler_csv
+    from dndfog.saving import open_file_dialog
+
+    mark_startup("imports")
+    set_profiler_csv(args.profile_csv)
 
     if args.file is not None:
         map_file = str(args.file)
@@ -20,11 +53,12 @@ def start() -> None:
             ext=[("PNG file", "png"), ("JPG file", "jpg"), ("JSON file", "json"), ("DND fog file", "dndfog")],
         )
 
+    mark_startup("file selection")
     if not map_file:
         msg = "No file selected."
         raise SystemExit(msg)
 
-    run(map_file)
+    run(map_file, frame_rate=args.fps, record=args.record)
 
 
 if __name__ == "__main__":
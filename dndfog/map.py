@@ -1,16 +1,182 @@
+from collections import OrderedDict
+from collections.abc import Callable, Generator
+from hashlib import sha256
+from math import ceil
+from threading import Thread
+from typing import Any
+
 import pygame
 
+from dndfog.types import EncodedImage, MapData
+
+MIPMAP_MIN_SIZE: int = 64
+"""Smallest width or height a mipmap level can have."""
+
+TILE_SIZE: int = 512
+"""Width and height of a background map tile, in pixels of the map at the current zoom level."""
+
+TILE_CACHE_BUDGET: int = 128 * 1024 * 1024
+"""How many bytes of scaled background map tiles to keep in memory at most."""
+
+TILE_CACHE_MAX_ENTRY: int = TILE_CACHE_BUDGET // 16
+"""Scaled tiles bigger than this many bytes are not kept, so that they can't push every other tile out."""
+
+
+class TileCache:
+    """Least recently used scaled background map tiles, up to a memory budget."""
+
+    def __init__(self, budget: int) -> None:
+        self.budget = budget
+        self.used: int = 0
+        self._tiles: OrderedDict[tuple[int, ...], pygame.Surface] = OrderedDict()
+
+    def get(self, key: tuple[int, ...]) -> pygame.Surface | None:
+        tile = self._tiles.get(key)
+        if tile is not None:
+            self._tiles.move_to_end(key)
+        return tile
+
+    def put(self, key: tuple[int, ...], tile: pygame.Surface) -> None:
+        if _tile_bytes(tile) > TILE_CACHE_MAX_ENTRY:
+            return
+
+        self._tiles[key] = tile
+        self.used += _tile_bytes(tile)
+        while self.used > self.budget:
+            _, evicted = self._tiles.popitem(last=False)
+            self.used -= _tile_bytes(evicted)
+
+    def clear(self) -> None:
+        self._tiles.clear()
+        self.used = 0
+
+
+_TILE_CACHE = TileCache(TILE_CACHE_BUDGET)
+
+
+def _tile_bytes(tile: pygame.Surface) -> int:
+    return tile.get_width() * tile.get_height() * tile.get_bytesize()
+
+
+def clear_tile_cache() -> None:
+    _TILE_CACHE.clear()
+
+
+def set_map_image(map_data: MapData, image: pygame.Surface, image_size: tuple[int, int] | None = None) -> None:
+    """Use the given image as the background map, drawn in the given size at the current zoom level."""
+    map_data.original_image = image
+    map_data.image_size = image_size if image_size is not None else image.get_size()
+    map_data.encoded_image = {}
+    clear_tile_cache()
+    build_mipmaps_in_background(map_data)
+
+
+def encode_map_image(
+    map_data: MapData,
+    kind: str,
+    encode: Callable[[pygame.Surface], bytes | str],
+) -> EncodedImage:
+    """Get the original image encoded with the given function, which is only called if it hasn't been already."""
+    encoded = map_data.encoded_image.get(kind)
+    if encoded is None:
+        encoded = map_data.encoded_image[kind] = encoded_image(encode(map_data.original_image))
+    return encoded
+
+
+def encoded_image(data: bytes | str) -> EncodedImage:
+    return EncodedImage(data=data, sha256=sha256(data.encode() if isinstance(data, str) else data).hexdigest())
+
 
 def zoom_map(
-    image: pygame.Surface,
-    original_image: pygame.Surface,
+    image_size: tuple[int, int],
     old_gridsize: int,
     new_gridsize: int,
-) -> pygame.Surface:
-    cur_x, cur_y = image.get_size()
+) -> tuple[int, int]:
+    cur_x, cur_y = image_size
     rel_x, rel_y = cur_x / old_gridsize, cur_y / old_gridsize
-    new_x, new_y = max(round(rel_x * new_gridsize), 1), max(round(rel_y * new_gridsize), 1)
-    return pygame.transform.scale(original_image, (new_x, new_y))
+    return max(round(rel_x * new_gridsize), 1), max(round(rel_y * new_gridsize), 1)
+
+
+def visible_map_tiles(
+    map_data: MapData,
+    position: tuple[int, int],
+    view: pygame.Rect,
+) -> Generator[tuple[pygame.Surface, tuple[int, int]], Any, None]:
+    """
+    Get the background map tiles that are inside the view, scaled to the current zoom level,
+    when the map's top left corner is at the given position.
+
+    Tiles are squares of the map as it's drawn, so that they are the same size at every zoom level,
+    and only the part of the image under each tile is scaled. Tiles are scaled only when first needed
+    and then cached.
+    """
+    level, source = _select_mipmap_level(map_data)
+    source_width, source_height = source.get_size()
+    width, height = map_data.image_size
+    scale_x, scale_y = width / source_width, height / source_height
+
+    first_column = max((view.left - position[0]) // TILE_SIZE, 0)
+    last_column = min((view.right - 1 - position[0]) // TILE_SIZE, (width - 1) // TILE_SIZE)
+    first_row = max((view.top - position[1]) // TILE_SIZE, 0)
+    last_row = min((view.bottom - 1 - position[1]) // TILE_SIZE, (height - 1) // TILE_SIZE)
+
+    for row in range(first_row, last_row + 1):
+        source_top, source_bottom, top, bottom = _tile_span(row, scale_y, source_height)
+        for column in range(first_column, last_column + 1):
+            source_left, source_right, left, right = _tile_span(column, scale_x, source_width)
+            if right <= left or bottom <= top:
+                continue
+
+            key = (level, column, row, *map_data.image_size)
+            tile = _TILE_CACHE.get(key)
+            if tile is None:
+                area = source.subsurface(
+                    source_left, source_top, source_right - source_left, source_bottom - source_top
+                )
+                tile = pygame.transform.scale(area, (right - left, bottom - top))
+                _TILE_CACHE.put(key, tile)
+
+            yield tile, (position[0] + left, position[1] + top)
+
+
+def _tile_span(index: int, scale: float, source_length: int) -> tuple[int, int, int, int]:
+    """
+    Get the pixels of the image under a tile in one direction, and where they start and end on the scaled map.
+    Tiles include every image pixel they partly cover, so the last pixel of a tile can be the first of the next,
+    but it's drawn in the same place for both.
+    """
+    start = int(index * TILE_SIZE / scale)
+    end = min(ceil((index + 1) * TILE_SIZE / scale), source_length)
+    return start, end, int(start * scale), int(end * scale)
+
+
+def _select_mipmap_level(map_data: MapData) -> tuple[int, pygame.Surface]:
+    """Get the smallest mipmap level that is still at least as big as the map at the current zoom level."""
+    width, height = map_data.image_size
+    index, source = -1, map_data.original_image
+    for i, level in enumerate(list(map_data.mipmaps)):
+        if level.get_width() < width or level.get_height() < height:
+            break
+        index, source = i, level
+    return index, source
+
+
+def build_mipmaps(original_image: pygame.Surface, mipmaps: list[pygame.Surface]) -> None:
+    """Add halved versions of the image to the given list, from the largest to the smallest."""
+    level = original_image
+    while min(level.get_size()) // 2 >= MIPMAP_MIN_SIZE:
+        level = pygame.transform.smoothscale(level, (level.get_width() // 2, level.get_height() // 2))
+        mipmaps.append(level)
+
+
+def build_mipmaps_in_background(map_data: MapData) -> None:
+    """
+    Build mipmaps for the map's original image in a background thread.
+    Levels can be used for zooming as soon as they are added.
+    """
+    map_data.mipmaps = []
+    thread = Thread(target=build_mipmaps, args=(map_data.original_image, map_data.mipmaps), daemon=True)
+    thread.start()
 
 
 def move_map(
@@ -1,39 +1,157 @@
+from itertools import count, pairwise
 from typing import Any, Generator
 
-from dndfog.types import MarkingData, Markings, ProgramState
+import pygame
 
+from dndfog.grid import draw_position_on_grid, position_on_grid
+from dndfog.math import clip_line
+from dndfog.types import MapData, ProgramState, StrokeData
 
-def add_markings(mouse_pos: tuple[int, int], state: ProgramState) -> None:
-    position = (mouse_pos[0] + state.map.camera[0], mouse_pos[1] + state.map.camera[1])
-
-    for marking in interpolate_line(position, state.map.last_marking):
-        state.map.markings[marking] = MarkingData(
-            place=marking,
-            size=state.selected.marker_size,
-            color=state.selected.marker_color,
-        )
-
-    state.map.last_marking = position
-
+_STROKE_IDS = count()
 
-def remove_markings(mouse_pos: tuple[int, int], state: ProgramState) -> None:
-    size = state.selected.marker_size.value * 10
-    low = 0 - size // 2
-    high = size - size // 2
-    for x in range(low, high):
-        for y in range(low, high):
-            position = (mouse_pos[0] + state.map.camera[0] + x, mouse_pos[1] + state.map.camera[1] + y)
-            state.map.markings.pop(position, None)
 
-
-def move_markings(old_camera: tuple[int, int], state: ProgramState) -> None:
-    dx = state.map.camera[0] - old_camera[0]
-    dy = state.map.camera[1] - old_camera[1]
-    new_markings: Markings = {}
-    for marking, data in state.map.markings.items():
-        data["place"] = (marking[0] + dx, marking[1] + dy)
-        new_markings[data["place"]] = data
-    state.map.markings = new_markings
+def add_markings(mouse_pos: tuple[int, int], state: ProgramState) -> None:
+    x, y = position_on_grid(mouse_pos, state.map.camera, state.map.gridsize)
+    point = round(x, 3), round(y, 3)
+    stroke = state.map.markings.get(state.map.stroke) if state.map.stroke is not None else None
+
+    # Start a new stroke
+    if stroke is None:
+        state.map.stroke = add_stroke(
+            StrokeData(
+                points=[point],
+                size=state.selected.marker_size.value / state.map.gridsize,
+                color=state.selected.marker_color,
+            ),
+            state,
+        )
+        state.map.markings_layer.segments.append((state.map.markings[state.map.stroke], 0))
+        return
+
+    # Continue the stroke, if the mouse has moved at least a pixel
+    last_x, last_y = stroke["points"][-1]
+    if max(abs(point[0] - last_x), abs(point[1] - last_y)) * state.map.gridsize >= 1:
+        stroke["points"].append(point)
+        state.map.markings_index.insert(state.map.stroke, stroke_bounds([(last_x, last_y), point], stroke["size"]))
+        state.map.markings_layer.segments.append((stroke, len(stroke["points"]) - 1))
+
+
+def add_stroke(stroke: StrokeData, state: ProgramState) -> int:
+    stroke_id = next(_STROKE_IDS)
+    state.map.markings[stroke_id] = stroke
+    state.map.markings_index.insert(stroke_id, stroke_bounds(stroke["points"], stroke["size"]))
+    return stroke_id
+
+
+def clear_markings(state: ProgramState) -> None:
+    state.map.markings = {}
+    state.map.markings_index.clear()
+    state.map.markings_layer.invalidate()
+
+
+def strokes_in_bounds(map_data: MapData, bounds: tuple[float, float, float, float]) -> list[StrokeData]:
+    """Get the strokes that might be inside the given bounds on the grid, in the order they were added."""
+    return [map_data.markings[stroke_id] for stroke_id in sorted(map_data.markings_index.query(bounds))]
+
+
+def eraser_bounds(mouse_pos: tuple[int, int], state: ProgramState) -> tuple[float, float, float, float]:
+    """Bounds (left, top, right, bottom) of the eraser on the grid at the given mouse position."""
+    x, y = position_on_grid(mouse_pos, state.map.camera, state.map.gridsize)
+    half = state.selected.marker_size.value * 10 / 2 / state.map.gridsize
+    return x - half, y - half, x + half, y + half
+
+
+def remove_markings(bounds: tuple[float, float, float, float], state: ProgramState) -> pygame.Rect | None:
+    """Erase the parts of strokes inside the given bounds on the grid, and return the changed area of the screen."""
+    changed: list[pygame.Rect] = []
+    for stroke_id in sorted(state.map.markings_index.query(bounds)):
+        stroke = state.map.markings[stroke_id]
+        parts = split_points(stroke["points"], bounds)
+        if len(parts) == 1 and parts[0] is stroke["points"]:
+            continue
+
+        changed.append(stroke_area(stroke, state.map.camera, state.map.gridsize))
+        del state.map.markings[stroke_id]
+        state.map.markings_index.remove(stroke_id)
+        for points in parts:
+            add_stroke(StrokeData(points=points, size=stroke["size"], color=stroke["color"]), state)
+
+    if not changed:
+        return None
+
+    area = changed[0].unionall(changed[1:])
+    state.map.markings_layer.damaged.append(area)
+    return area
+
+
+def split_points(
+    points: list[tuple[float, float]],
+    bounds: tuple[float, float, float, float],
+) -> list[list[tuple[float, float]]]:
+    """
+    Split a line going through the given points into the parts that are outside the given bounds.
+    If no part of the line is inside the bounds, the original list of points is returned as the only part.
+    """
+    if len(points) == 1:
+        left, top, right, bottom = bounds
+        inside = left <= points[0][0] <= right and top <= points[0][1] <= bottom
+        return [] if inside else [points]
+
+    parts: list[list[tuple[float, float]]] = []
+    current: list[tuple[float, float]] = []
+    erased = False
+    for start, end in pairwise(points):
+        clipped = clip_line(start, end, bounds)
+        if clipped is None:
+            current = current or [start]
+            current.append(end)
+            continue
+
+        erased = True
+        enter, leave = clipped
+        if enter != start:
+            current = current or [start]
+            current.append(enter)
+        if current:
+            parts.append(current)
+        current = [leave, end] if leave != end else []
+
+    if not erased:
+        return [points]
+
+    if current:
+        parts.append(current)
+    return parts
+
+
+def stroke_area(stroke: StrokeData, camera: tuple[int, int], gridsize: int) -> pygame.Rect:
+    """Area of the screen covered by the given stroke."""
+    return _points_area(stroke["points"], stroke["size"], camera, gridsize)
+
+
+def last_segment_area(stroke: StrokeData, camera: tuple[int, int], gridsize: int) -> pygame.Rect:
+    """Area of the screen covered by the last segment of the given stroke."""
+    return _points_area(stroke["points"][-2:], stroke["size"], camera, gridsize)
+
+
+def stroke_bounds(points: list[tuple[float, float]], size: float) -> tuple[float, float, float, float]:
+    """Bounds (left, top, right, bottom) of a stroke through the given points on the grid."""
+    xs = [point[0] for point in points]
+    ys = [point[1] for point in points]
+    return min(xs) - size, min(ys) - size, max(xs) + size, max(ys) + size
+
+
+def _points_area(
+    points: list[tuple[float, float]],
+    size: float,
+    camera: tuple[int, int],
+    gridsize: int,
+) -> pygame.Rect:
+    bounds = stroke_bounds(points, size)
+    left, top = draw_position_on_grid(bounds[:2], camera, gridsize)
+    right, bottom = draw_position_on_grid(bounds[2:], camera, gridsize)
+    # Add a couple of pixels for rounding and line widths
+    return pygame.Rect(left - 2, top - 2, right - left + 5, bottom - top + 5)
 
 
 def interpolate_line(
@@ -46,11 +164,13 @@ def interpolate_line(
     if abs(point_2[1] - point_1[1]) < abs(point_2[0] - point_1[0]):
         if point_1[0] > point_2[0]:
             yield from _interpolate_low(point_2, point_1)
-        yield from _interpolate_low(point_1, point_2)
+        else:
+            yield from _interpolate_low(point_1, point_2)
 
-    if point_1[1] > point_2[1]:
+    elif point_1[1] > point_2[1]:
         yield from _interpolate_high(point_2, point_1)
-    yield from _interpolate_high(point_1, point_2)
+    else:
+        yield from _interpolate_high(point_1, point_2)
 
 
 def _interpolate_high(point_1: tuple[int, int], point_2: tuple[int, int]) -> Generator[tuple[int, int], Any, None]:
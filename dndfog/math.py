@@ -13,3 +13,39 @@ def color_tuple_from_hsla(hsla: tuple[int, int, int, int]) -> tuple[int, int, in
     color = pygame.Color(0)
     color.hsla = hsla
     return color.r, color.g, color.b
+
+
+def clip_line(
+    start: tuple[float, float],
+    end: tuple[float, float],
+    bounds: tuple[float, float, float, float],
+) -> tuple[tuple[float, float], tuple[float, float]] | None:
+    """
+    Get the part of the line segment that is inside the given bounds (left, top, right, bottom),
+    or None if the line segment doesn't touch the bounds. Uses the Liang-Barsky algorithm.
+    """
+    left, top, right, bottom = bounds
+    dx, dy = end[0] - start[0], end[1] - start[1]
+    low, high = 0.0, 1.0
+
+    checks = (
+        (-dx, start[0] - left),
+        (dx, right - start[0]),
+        (-dy, start[1] - top),
+        (dy, bottom - start[1]),
+    )
+    for step, distance in checks:
+        if step == 0:
+            if distance < 0:
+                return None
+            continue
+
+        ratio = distance / step
+        if step < 0:
+            low = max(low, ratio)
+        else:
+            high = min(high, ratio)
+        if low > high:
+            return None
+
+    return (start[0] + low * dx, start[1] + low * dy), (start[0] + high * dx, start[1] + high * dy)
@@ -0,0 +1,39 @@
+import sys
+import time
+
+import pygame
+
+from dndfog.types import ProgramState
+
+MESSAGE_DURATION: float = 8
+"""Seconds a message is shown for."""
+
+MESSAGE_SIZE: tuple[int, int] = (600, 30)
+
+__all__ = [
+    "expire_message",
+    "message_area",
+    "show_message",
+]
+
+
+def show_message(state: ProgramState, text: str) -> None:
+    """Show a message to the user for a while, for problems that don't stop the program, like a failed save."""
+    state.message = text
+    state.message_until = time.monotonic() + MESSAGE_DURATION
+    state.redraw.everything()
+    # Also for when there is no window to show the message in
+    sys.stderr.write(f"{text}\n")
+
+
+def expire_message(state: ProgramState) -> None:
+    """Hide the message once it has been shown long enough."""
+    if state.message is not None and time.monotonic() >= state.message_until:
+        state.message = None
+        state.redraw.everything()
+
+
+def message_area(display_size: tuple[int, int]) -> pygame.Rect:
+    """Area of the message in the middle of the bottom of the screen."""
+    width, height = MESSAGE_SIZE
+    return pygame.Rect((display_size[0] - width) // 2, display_size[1] - height - 10, width, height)
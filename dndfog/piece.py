@@ -1,23 +1,23 @@
 from random import randint
 
-from dndfog.types import ORIG_COLORS, PieceData, PieceSize
+import pygame
+
+from dndfog.grid import area_on_screen
+from dndfog.types import ORIG_COLORS, MapData, Piece, PieceSize
 
 
 def add_piece(
     add_place: tuple[int, int],
-    pieces: dict[tuple[int, int], PieceData],
+    map_data: MapData,
     colors: list[tuple[int, int, int]],
     selected_size: PieceSize,
-) -> None:
-    overlap_with_other_pieces = any(
-        (add_place[0] + x, add_place[1] + y) in pieces
-        for x in range(selected_size.value)
-        for y in range(selected_size.value)
-    )
+) -> Piece | None:
+    piece = Piece(place=add_place, color=(0, 0, 0), size=selected_size)
+    overlap_with_other_pieces = any(cell in map_data.occupancy for cell in piece.cells())
     if overlap_with_other_pieces:
-        return
+        return None
 
-    color = (
+    piece.color = (
         # Prefedined Color
         colors.pop(0)
         if len(colors) > 0
@@ -25,71 +25,83 @@ def add_piece(
         else (randint(0, 255), randint(0, 255), randint(0, 255))
     )
 
-    for x in range(selected_size.value):
-        for y in range(selected_size.value):
-            pieces[(add_place[0] + x, add_place[1] + y)] = PieceData(
-                parent=add_place,
-                place=(add_place[0] + x, add_place[1] + y),
-                color=color,
-                size=selected_size,
-                show=(x == 0 and y == 0),
-            )
+    place_piece(piece, map_data)
+    return piece
+
+
+def place_piece(piece: Piece, map_data: MapData) -> None:
+    map_data.pieces.add(piece)
+    map_data.pieces_index.insert(piece, piece_bounds(piece))
+    for cell in piece.cells():
+        map_data.occupancy[cell] = piece
+
+
+def clear_pieces(map_data: MapData) -> None:
+    map_data.pieces = set()
+    map_data.pieces_index.clear()
+    map_data.occupancy = {}
 
 
 def remove_piece(
     next_place: tuple[int, int],
-    pieces: dict[tuple[int, int], PieceData],
+    map_data: MapData,
     colors: list[tuple[int, int, int]],
-) -> None:
-    piece_data: PieceData | None = pieces.get(next_place)
-    if piece_data is not None:
-        place = piece_data["parent"]
-        size = piece_data["size"]
-        color = piece_data["color"]
+) -> Piece | None:
+    piece = map_data.occupancy.get(next_place)
+    if piece is None:
+        return None
+
+    map_data.pieces.discard(piece)
+    map_data.pieces_index.remove(piece)
+    for cell in piece.cells():
+        map_data.occupancy.pop(cell, None)
+
+    if piece.color in ORIG_COLORS and piece.color not in colors:
+        colors.insert(0, piece.color)
 
-        for x in range(size.value):
-            for y in range(size.value):
-                pieces.pop((place[0] + x, place[1] + y), None)
-                if color in ORIG_COLORS and color not in colors:
-                    colors.insert(0, color)
+    return piece
 
 
 def move_piece(
     current_place: tuple[int, int],
     next_place: tuple[int, int],
-    pieces: dict[tuple[int, int], PieceData],
+    map_data: MapData,
 ) -> tuple[int, int]:
-    piece_to_move = pieces[current_place]
-    piece_place = piece_to_move["parent"]
-    piece_size = piece_to_move["size"]
+    if next_place == current_place:
+        return current_place
 
+    piece = map_data.occupancy[current_place]
     movement = (next_place[0] - current_place[0], next_place[1] - current_place[1])
-    current_self_positions = {
-        (piece_place[0] + x, piece_place[1] + y) for x in range(piece_size.value) for y in range(piece_size.value)
-    }
+    new_place = (piece.place[0] + movement[0], piece.place[1] + movement[1])
+
+    overlap_with_other_pieces = any(map_data.occupancy.get(cell, piece) is not piece for cell in piece.cells(new_place))
+    if overlap_with_other_pieces:
+        return current_place
+
+    for cell in piece.cells():
+        del map_data.occupancy[cell]
+
+    piece.place = new_place
+    for cell in piece.cells():
+        map_data.occupancy[cell] = piece
+
+    map_data.pieces_index.remove(piece)
+    map_data.pieces_index.insert(piece, piece_bounds(piece))
+
+    return next_place
 
-    next_self_positions = {(x + movement[0], y + movement[1]) for x, y in current_self_positions}
-    no_overlap_with_other_pieces = not any(
-        pos in pieces for pos in next_self_positions if pos not in current_self_positions
-    )
 
-    moving = current_place
+def piece_area(piece: Piece, camera: tuple[int, int], gridsize: int) -> pygame.Rect:
+    """Area of the screen covered by the given piece."""
+    return area_on_screen(piece.place, (piece.size.value, piece.size.value), camera, gridsize)
 
-    if next_place != current_place and no_overlap_with_other_pieces:
-        # Remove own positions
-        for self_pos in current_self_positions:
-            pieces.pop(self_pos, None)
 
-        # Add own positions back
-        for self_pos in current_self_positions:
-            pieces[(self_pos[0] + movement[0], self_pos[1] + movement[1])] = PieceData(
-                parent=(piece_place[0] + movement[0], piece_place[1] + movement[1]),
-                place=(self_pos[0] + movement[0], self_pos[1] + movement[1]),
-                color=piece_to_move["color"],
-                size=piece_size,
-                show=(self_pos[0] == piece_place[0] and self_pos[1] == piece_place[1]),
-            )
+def piece_bounds(piece: Piece) -> tuple[float, float, float, float]:
+    """Bounds (left, top, right, bottom) of the given piece on the grid."""
+    x, y = piece.place
+    return x, y, x + piece.size.value, y + piece.size.value
 
-        moving = next_place
 
-    return moving
+def pieces_in_bounds(map_data: MapData, bounds: tuple[float, float, float, float]) -> set[Piece]:
+    """Get the pieces that might be inside the given bounds on the grid."""
+    return map_data.pieces_index.query(bounds)
@@ -0,0 +1,142 @@
+import time
+from collections import deque
+from typing import TextIO
+
+import pygame
+
+PROFILER_WINDOW: int = 300
+"""How many of the latest frames the timings shown in the profiler are calculated from."""
+
+PROFILER_STAGES: tuple[str, ...] = ("events", "map", "grid", "pieces", "fog", "markings", "toolbar", "flip")
+"""Stages of a frame that are timed, in the order they happen."""
+
+PROFILER_COUNTERS: tuple[str, ...] = ("skipped", "idle")
+"""
+Counters written to the CSV file after the timings: how many frames have been skipped since there was nothing
+to draw, and how many times the program has waited for events since there was nothing to do.
+"""
+
+PROFILER_LINE_HEIGHT: int = 20
+PROFILER_WIDTH: int = 300
+
+__all__ = [
+    "PROFILER_COUNTERS",
+    "PROFILER_STAGES",
+    "close_profiler",
+    "enable_profiling",
+    "end_profiled_frame",
+    "mark_stage",
+    "profiler_area",
+    "set_profiler_csv",
+    "stage_percentiles",
+    "start_profiled_frame",
+]
+
+
+class FrameProfiler:
+    """
+    Times the stages of each frame while enabled, and keeps the timings of the latest frames.
+    Timings can also be written to a CSV file, with one row per frame.
+    """
+
+    def __init__(self, window: int) -> None:
+        self.enabled: bool = False
+        self.timing: bool = False
+        """Is the current frame being timed? Enabling the profiler takes effect on the next frame."""
+        self.csv_path: str | None = None
+        self._csv: TextIO | None = None
+        self._times: dict[str, deque[float]] = {stage: deque(maxlen=window) for stage in PROFILER_STAGES}
+        self._frame: dict[str, float] = {}
+        self._frame_number: int = 0
+        self._last: float = 0
+
+    def start_frame(self) -> None:
+        self.timing = self.enabled
+        if self.timing:
+            self._frame.clear()
+            self._last = time.perf_counter()
+
+    def mark(self, stage: str) -> None:
+        """Mark the end of a stage of the frame, which started when the previous one ended."""
+        if not self.timing:
+            return
+
+        now = time.perf_counter()
+        self._frame[stage] = self._frame.get(stage, 0) + (now - self._last) * 1000
+        self._last = now
+
+    def end_frame(self, counters: tuple[int, ...]) -> None:
+        """End the timed frame, with the values of `PROFILER_COUNTERS` at its end."""
+        if not self.timing or not self._frame:
+            return
+
+        for stage, duration in self._frame.items():
+            self._times[stage].append(duration)
+
+        self._frame_number += 1
+        if self.csv_path is not None:
+            self._write_row(counters)
+
+    def percentiles(self) -> dict[str, tuple[float, float, float]]:
+        """50th, 95th and 99th percentile of the timings of each stage, in milliseconds."""
+        result: dict[str, tuple[float, float, float]] = {}
+        for stage, times in self._times.items():
+            ordered = sorted(times) or [0.0]
+            last = len(ordered) - 1
+            result[stage] = (ordered[round(0.5 * last)], ordered[round(0.95 * last)], ordered[round(0.99 * last)])
+        return result
+
+    def close(self) -> None:
+        if self._csv is not None:
+            self._csv.close()
+        self._csv = None
+
+    def _write_row(self, counters: tuple[int, ...]) -> None:
+        if self._csv is None:
+            self._csv = open(self.csv_path, "w")  # noqa: SIM115
+            self._csv.write(",".join(("frame", "time", *PROFILER_STAGES, *PROFILER_COUNTERS)) + "\n")
+
+        # Stages that didn't happen in the frame, like drawing when there was nothing to draw, are left empty
+        durations = (f"{self._frame[stage]:.3f}" if stage in self._frame else "" for stage in PROFILER_STAGES)
+        counts = (str(count) for count in counters)
+        self._csv.write(",".join((str(self._frame_number), f"{time.time():.3f}", *durations, *counts)) + "\n")
+
+
+_PROFILER = FrameProfiler(PROFILER_WINDOW)
+
+
+def enable_profiling(enabled: bool) -> None:
+    _PROFILER.enabled = enabled
+
+
+def set_profiler_csv(path: str | None) -> None:
+    """Write the timings of every profiled frame to the given CSV file."""
+    _PROFILER.close()
+    _PROFILER.csv_path = path
+
+
+def start_profiled_frame() -> None:
+    _PROFILER.start_frame()
+
+
+def mark_stage(stage: str) -> None:
+    _PROFILER.mark(stage)
+
+
+def end_profiled_frame(skipped: int, idle: int) -> None:
+    _PROFILER.end_frame((skipped, idle))
+
+
+def stage_percentiles() -> dict[str, tuple[float, float, float]]:
+    return _PROFILER.percentiles()
+
+
+def close_profiler() -> None:
+    _PROFILER.close()
+
+
+def profiler_area(display_size: tuple[int, int]) -> pygame.Rect:
+    """Area of the profiler in the bottom left corner of the screen."""
+    # Header, entity counts and loop counts, in addition to the stages
+    height = PROFILER_LINE_HEIGHT * (len(PROFILER_STAGES) + 3) + 10
+    return pygame.Rect(10, display_size[1] - height - 10, PROFILER_WIDTH, height)
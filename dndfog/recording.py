@@ -0,0 +1,122 @@
+import json
+import random
+import time
+from typing import Any, TextIO
+
+import pygame
+
+from dndfog.types import Event, LoopData
+
+RECORDING_VERSION: int = 1
+"""Version of the format of recorded sessions."""
+
+__all__ = [
+    "read_recording",
+    "record_frame",
+    "start_recording",
+    "stop_recording",
+]
+
+
+class Recorder:
+    """
+    Records the events and the loop data given to the event handlers on each frame to a file,
+    with a header line followed by one JSON object per frame, so that the session can be replayed later.
+    """
+
+    def __init__(self) -> None:
+        self._file: TextIO | None = None
+        self._start: float = 0
+
+    def start(self, path: str, map_file: str, display_size: tuple[int, int]) -> None:
+        self.stop()
+        # Random colors for pieces are picked the same way when replaying
+        seed = random.randrange(2**32)
+        random.seed(seed)
+        header = {
+            "version": RECORDING_VERSION,
+            "map_file": map_file,
+            "display_size": display_size,
+            "seed": seed,
+            "pygame": pygame.version.ver,
+        }
+        self._file = open(path, "w")  # noqa: SIM115
+        self._file.write(json.dumps(header) + "\n")
+        self._start = time.perf_counter()
+
+    def record(self, loop: LoopData, events: list[Event]) -> None:
+        if self._file is None:
+            return
+
+        frame = {
+            "time": round(time.perf_counter() - self._start, 4),
+            "loop": loop,
+            # Events from the program itself, like finished saves, happen again when replaying
+            "events": [serialize_event(event) for event in events if event.type < pygame.USEREVENT],
+        }
+        self._file.write(json.dumps(frame) + "\n")
+
+    def stop(self) -> None:
+        if self._file is not None:
+            self._file.close()
+        self._file = None
+
+
+_RECORDER = Recorder()
+
+
+def start_recording(path: str, map_file: str, display_size: tuple[int, int]) -> None:
+    _RECORDER.start(path, map_file, display_size)
+
+
+def record_frame(loop: LoopData, events: list[Event]) -> None:
+    _RECORDER.record(loop, events)
+
+
+def stop_recording() -> None:
+    _RECORDER.stop()
+
+
+def serialize_event(event: Event) -> dict[str, Any]:
+    """Event type and the attributes of the event that can be saved as JSON, like positions and keys."""
+    attributes = {key: value for key, value in event.dict.items() if _is_json_value(value)}
+    return {"type": event.type, **attributes}
+
+
+def deserialize_event(data: dict[str, Any]) -> Event:
+    attributes = {key: tuple(value) if isinstance(value, list) else value for key, value in data.items()}
+    return pygame.event.Event(attributes.pop("type"), **attributes)
+
+
+def read_recording(path: str) -> tuple[dict[str, Any], list[tuple[LoopData, list[Event]]]]:
+    """Read the header of a recorded session, and the loop data and events of each frame."""
+    with open(path, "r") as f:
+        header = json.loads(f.readline())
+        if header["version"] > RECORDING_VERSION:
+            msg = "Recording is from a newer version."
+            raise RuntimeError(msg)
+
+        frames: list[tuple[LoopData, list[Event]]] = []
+        for line in f:
+            # The last frame is incomplete if the program crashed while recording
+            try:
+                frame = json.loads(line)
+            except json.JSONDecodeError:
+                break
+            mouse_pos, grid_pos, mouse_speed, pressed_modifiers, pressed_buttons = frame["loop"]
+            loop = LoopData(
+                mouse_pos=tuple(mouse_pos),
+                grid_pos=tuple(grid_pos),
+                mouse_speed=tuple(mouse_speed),
+                pressed_modifiers=pressed_modifiers,
+                pressed_buttons=tuple(pressed_buttons),
+            )
+            frames.append((loop, [deserialize_event(event) for event in frame["events"]]))
+
+    return header, frames
+
+
+def _is_json_value(value: Any) -> bool:
+    if isinstance(value, list | tuple):
+        return all(isinstance(item, int | float | str | bool) for item in value)
+    return value is None or isinstance(value, int | float | str | bool)
@@ -0,0 +1,86 @@
+import os
+import random
+import sys
+import time
+
+import pygame
+
+from dndfog.draw import draw
+from dndfog.event_handlers import coalesce_mouse_motion, handle_event
+from dndfog.profiler import (
+    enable_profiling,
+    end_profiled_frame,
+    mark_stage,
+    stage_percentiles,
+    start_profiled_frame,
+)
+from dndfog.recording import read_recording
+from dndfog.saving import finish_loading_map, load_map, wait_for_saves
+from dndfog.types import Event, ProgramState
+
+__all__ = [
+    "replay_session",
+]
+
+
+def replay_session(map_file: str, path: str) -> None:
+    """
+    Replay a recorded session on the given map as fast as possible, without showing a window,
+    through the same event handlers and drawing as when it was recorded. Prints how long the frames took.
+    """
+    header, frames = read_recording(path)
+    random.seed(header["seed"])
+
+    os.environ.setdefault("SDL_VIDEODRIVER", "dummy")
+    pygame.init()
+    display = pygame.display.set_mode(tuple(header["display_size"]), flags=pygame.SRCALPHA)
+
+    state = ProgramState()
+    load_map(map_file, state)
+    finish_loading_map(state, wait=True)
+    # Don't journal or save the replayed changes over the file
+    state.file = None
+    pygame.event.clear()
+
+    enable_profiling(enabled=True)
+    frame_times: list[float] = []
+    start = time.perf_counter()
+    for loop, events in frames:
+        frame_start = time.perf_counter()
+        start_profiled_frame()
+
+        for event in coalesce_mouse_motion(events):
+            if is_replayable(event):
+                handle_event(event, loop, state)
+        mark_stage("events")
+
+        draw(display, loop, state)
+        end_profiled_frame(skipped=state.redraw.skipped, idle=state.redraw.idle)
+        frame_times.append((time.perf_counter() - frame_start) * 1000)
+
+    total = time.perf_counter() - start
+    wait_for_saves()
+    report_replay(frame_times, total)
+    pygame.quit()
+
+
+def is_replayable(event: Event) -> bool:
+    """Events that quit the program or open file dialogs are skipped when replaying."""
+    if event.type == pygame.QUIT:
+        return False
+    return not (event.type == pygame.KEYDOWN and event.mod & pygame.KMOD_CTRL and event.key in {pygame.K_s, pygame.K_o})
+
+
+def report_replay(frame_times: list[float], total: float) -> None:
+    ordered = sorted(frame_times) or [0.0]
+    last = len(ordered) - 1
+    lines = [
+        f"frames {len(frame_times)} in {total:.3f} s",
+        f"{'frame':<10} p50 {ordered[round(0.5 * last)]:7.2f}  p95 {ordered[round(0.95 * last)]:7.2f}  "
+        f"p99 {ordered[round(0.99 * last)]:7.2f}  max {ordered[-1]:7.2f} ms",
+    ]
+    lines += [
+        f"{stage:<10} p50 {p50:7.2f}  p95 {p95:7.2f}  p99 {p99:7.2f} ms"
+        for stage, (p50, p95, p99) in stage_percentiles().items()
+    ]
+    sys.stdout.write("\n".join(lines) + "\n")
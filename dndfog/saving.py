@@ -2,30 +2,60 @@ import base64
 import gzip
 import json
 import os
+import tempfile
+from collections.abc import Callable
+from contextlib import suppress
+from functools import partial
 from pathlib import Path
+from threading import Lock, Thread
 from typing import Optional
 
 import pygame
-import pywintypes
-from win32con import OFN_ALLOWMULTISELECT, OFN_EXPLORER
-from win32gui import GetOpenFileNameW, GetSaveFileNameW
 
+from dndfog.chunks import FogChunks
+from dndfog.container import is_container, read_container, read_container_image, write_container
+from dndfog.journal import mark_checkpoint, replay_journal
+from dndfog.map import encoded_image, set_map_image
+from dndfog.markings import add_stroke, clear_markings
+from dndfog.messages import show_message
+from dndfog.piece import clear_pieces, place_piece
 from dndfog.types import (
     ORIG_COLORS,
     BackgroundImage,
-    MarkerSize,
+    EncodedImage,
     MarkingData,
-    PieceData,
+    Piece,
     PieceSize,
     ProgramState,
     SaveData,
+    SaveDataFog,
+    StrokeData,
 )
 
+SAVE_FINISHED: int = pygame.event.custom_type()
+"""
+Event posted when a background save has been written, with the `file`, `journal_seq` and `error` attributes.
+"""
+
+MAP_LOADED: int = pygame.event.custom_type()
+"""Event posted when a background map has been loaded in the background."""
+
+SAVING_INDICATOR_SIZE: tuple[int, int] = (100, 30)
+
+AUTOSAVE_SUFFIX: str = ".autosave"
+"""
+Suffix of the file next to a map that checkpoints are saved to, so that the map itself
+is only replaced when it's saved explicitly.
+"""
+
 __all__ = [
     "open_file_dialog",
     "save_file_dialog",
     "open_data_file",
     "save_data_file",
+    "autosave_path",
+    "is_saving",
+    "wait_for_saves",
 ]
 
 
@@ -40,15 +70,127 @@ def load_map(map_file: str, state: ProgramState) -> None:
 
     # Load background image
     if extension in [".png", ".jpg", ".jpeg"]:
-        state.map.image = pygame.image.load(map_file).convert_alpha()
-        state.map.image.set_colorkey((255, 255, 255))
-        state.map.original_image = state.map.image.copy()
+        _LOADER.load(partial(load_image_file, map_file), image_size=None)
         return
 
     msg = "Unsupported file type."
     raise RuntimeError(msg)
 
 
+def load_image_file(map_file: str) -> tuple[pygame.Surface, dict[str, EncodedImage]]:
+    image = pygame.image.load(map_file).convert_alpha()
+    image.set_colorkey((255, 255, 255))
+    # Turn the colorkey into per pixel alpha, since blitting a surface with both is slow
+    return image.convert_alpha(), {}
+
+
+class BackgroundLoader:
+    """
+    Decodes background maps in a worker thread, so that the rest of the map can be shown
+    and used while the background map loads. Posts a `MAP_LOADED` event when done.
+    """
+
+    def __init__(self) -> None:
+        self._thread: Thread | None = None
+        self._image: pygame.Surface | None = None
+        self._encoded: dict[str, EncodedImage] = {}
+        self._image_size: tuple[int, int] | None = None
+        self._zoom: float = 1
+        self._error: Exception | None = None
+
+    @property
+    def busy(self) -> bool:
+        return self._thread is not None and self._thread.is_alive()
+
+    @property
+    def loading(self) -> bool:
+        """Is a background map being loaded, or loaded but not yet used?"""
+        return self._thread is not None
+
+    def load(
+        self, decode: Callable[[], tuple[pygame.Surface, dict[str, EncodedImage]]], image_size: tuple[int, int] | None
+    ) -> None:
+        """
+        Start decoding a background map with the given function. The map will be drawn in the given size,
+        or its own size if not given. A map that is still being loaded can't be cancelled, so wait for it first.
+        """
+        # The earlier map is replaced, so it doesn't matter if it failed to load
+        with suppress(Exception):
+            self.finish()
+        self._image_size = image_size
+        self._zoom = 1
+        self._thread = Thread(target=self._run, args=(decode,), daemon=True)
+        self._thread.start()
+
+    def finish(self) -> tuple[pygame.Surface, dict[str, EncodedImage], tuple[int, int] | None] | None:
+        """
+        Wait for the background map being loaded, and return it with its encodings from the save file and
+        the size it should be drawn in, if one is being loaded.
+        """
+        if self._thread is None:
+            return None
+
+        self._thread.join()
+        self._thread = None
+        image, encoded, error = self._image, self._encoded, self._error
+        self._image, self._encoded, self._error = None, {}, None
+        if error is not None:
+            raise error
+        return image, encoded, self._image_size
+
+    def zoom(self, old_gridsize: int, new_gridsize: int) -> None:
+        """
+        Zoom the background map being loaded, if it's drawn in its own size. There is nothing to zoom
+        before it has been loaded, so the zoom is applied when it's used.
+        """
+        if self.loading and self._image_size is None:
+            self._zoom *= new_gridsize / old_gridsize
+
+    def zoomed_size(self, size: tuple[int, int]) -> tuple[int, int]:
+        """Size of a background map of the given size, zoomed as much as the map has been zoomed while loading."""
+        return max(round(size[0] * self._zoom), 1), max(round(size[1] * self._zoom), 1)
+
+    def _run(self, decode: Callable[[], tuple[pygame.Surface, dict[str, EncodedImage]]]) -> None:
+        try:
+            self._image, self._encoded = decode()
+        except Exception as exc:  # noqa: BLE001
+            self._error = exc
+        pygame.event.post(pygame.event.Event(MAP_LOADED))
+
+
+_LOADER = BackgroundLoader()
+
+
+def is_loading_map() -> bool:
+    return _LOADER.loading
+
+
+def zoom_loading_map(old_gridsize: int, new_gridsize: int) -> None:
+    _LOADER.zoom(old_gridsize, new_gridsize)
+
+
+def finish_loading_map(state: ProgramState, wait: bool = False) -> None:
+    """Use the background map that has been loaded in the background, if it's ready, or wait for it."""
+    if _LOADER.busy and not wait:
+        return
+
+    try:
+        loaded = _LOADER.finish()
+    except Exception as error:  # noqa: BLE001
+        # Keep the preview, if there is one, so that the rest of the map can still be used
+        show_message(state, f"Background map can't be loaded: {error}")
+        return
+    if loaded is None:
+        return
+
+    image, encoded, image_size = loaded
+    # Use the current size for maps with a preview, since the zoom level can change while loading.
+    # Maps without one have no size until loaded, so the zoom is applied to the map's own size.
+    image_size = state.map.image_size if image_size is not None else _LOADER.zoomed_size(image.get_size())
+    set_map_image(state.map, image, image_size)
+    state.map.encoded_image.update(encoded)
+
+
 def open_file_dialog(
     title: Optional[str] = None,
     directory: Optional[str] = None,
@@ -72,6 +214,10 @@ def open_file_dialog(
     :raises IOError: File open dialog failed.
     """
     # https://programtalk.com/python-examples/win32gui.GetOpenFileNameW/
+    # Imported here, since the dialogs are rarely needed, and the modules are slow to import
+    import pywintypes
+    from win32con import OFN_ALLOWMULTISELECT, OFN_EXPLORER
+    from win32gui import GetOpenFileNameW
 
     if directory is None:
         directory = os.getcwd()
@@ -131,6 +277,8 @@ def save_file_dialog(
     :raises IOError: File save dialog failed.
     """
     # https://programtalk.com/python-examples/win32gui.GetSaveFileNameW/
+    import pywintypes
+    from win32gui import GetSaveFileNameW
 
     if directory is None:
         directory = os.getcwd()
@@ -157,59 +305,213 @@ def save_file_dialog(
         return file_path
 
 
-def save_data_file(state: ProgramState) -> None:
-    data = state.to_json()
-    with open(state.file, "w") as f:
-        json.dump(data, f, indent=2)
+class BackgroundSaver:
+    """
+    Writes save files in a worker thread, so that the program doesn't freeze while saving.
+    Saves to a file that are requested while an earlier save is being written are coalesced,
+    so that only the latest one is written after it.
+    """
+
+    def __init__(self) -> None:
+        self._lock = Lock()
+        self._pending: dict[str, ProgramState] = {}
+        """Snapshots to save by the path to save them to."""
+        self._thread: Thread | None = None
+
+    @property
+    def busy(self) -> bool:
+        with self._lock:
+            return self._thread is not None
+
+    def save(self, snapshot: ProgramState, path: str) -> None:
+        with self._lock:
+            self._pending[path] = snapshot
+            if self._thread is None:
+                self._thread = Thread(target=self._run, daemon=True)
+                self._thread.start()
+
+    def wait(self) -> None:
+        thread = self._thread
+        if thread is not None:
+            thread.join()
+
+    def _run(self) -> None:
+        while True:
+            with self._lock:
+                if not self._pending:
+                    self._thread = None
+                    return
+                path = next(iter(self._pending))
+                snapshot = self._pending.pop(path)
+
+            error: Exception | None = None
+            try:
+                write_data_file(snapshot, path)
+            except Exception as exc:  # noqa: BLE001
+                error = exc
+            event = pygame.event.Event(
+                SAVE_FINISHED, file=snapshot.file, journal_seq=snapshot.map.journal_seq, error=error
+            )
+            pygame.event.post(event)
+
+
+_SAVER = BackgroundSaver()
+
+
+def save_data_file(state: ProgramState, autosave: bool = False) -> None:
+    """
+    Save the program state to its file in the background. See `BackgroundSaver`.
+    Autosaves go to a file next to it instead, see `AUTOSAVE_SUFFIX`.
+    """
+    # The background map must be loaded, or the preview would be saved instead
+    finish_loading_map(state, wait=True)
+    _SAVER.save(state.snapshot(), autosave_path(state.file) if autosave else state.file)
+    mark_checkpoint()
+
+
+def autosave_path(file: str) -> str:
+    return f"{file}{AUTOSAVE_SUFFIX}"
+
+
+def is_saving() -> bool:
+    return _SAVER.busy
+
+
+def wait_for_saves() -> None:
+    _SAVER.wait()
+
+
+def saving_indicator_area(display_size: tuple[int, int]) -> pygame.Rect:
+    """Area of the screen where the indicator for saves in progress is drawn."""
+    width, height = SAVING_INDICATOR_SIZE
+    return pygame.Rect(display_size[0] - width - 10, display_size[1] - height - 10, width, height)
+
+
+def write_data_file(state: ProgramState, path: str | None = None) -> None:
+    """
+    Write the save file, or the given file, through a temporary file that replaces the file when it's complete,
+    so that a failed or interrupted save leaves the previous save file as it was.
+    """
+    path = path if path is not None else state.file
+    fd, temp_file = tempfile.mkstemp(dir=os.path.dirname(os.path.abspath(path)), suffix=".tmp")
+    os.close(fd)
+    try:
+        if Path(path).suffix in {".dndfog", AUTOSAVE_SUFFIX}:
+            write_container(temp_file, state)
+        else:
+            with open(temp_file, "w") as f:
+                json.dump(state.to_json(), f, indent=2)
+        os.replace(temp_file, path)
+    except BaseException:
+        with suppress(OSError):
+            os.remove(temp_file)
+        raise
+
+    # The save file is now newer than its autosave. Removed here, so that a later autosave isn't removed instead.
+    if path == state.file:
+        with suppress(FileNotFoundError):
+            os.remove(autosave_path(state.file))
 
 
 def open_data_file(state: ProgramState) -> None:
-    with open(state.file, "r") as f:
-        data: SaveData = json.load(f)
+    data, preview, decode = read_data_file(state.file)
+
+    # Open the autosave instead, if changes were autosaved after the map was last saved
+    autosave = autosave_path(state.file)
+    if os.path.exists(autosave):
+        try:
+            autosave_data, autosave_preview, autosave_decode = read_data_file(autosave)
+        except Exception as error:  # noqa: BLE001
+            show_message(state, f"Autosave can't be opened: {error}")
+        else:
+            if autosave_data["map"].get("journal_seq", 0) > data["map"].get("journal_seq", 0):
+                data, preview, decode = autosave_data, autosave_preview, autosave_decode
 
     state.map.gridsize = int(data["map"]["gridsize"])
-    state.map.removed_fog = set(data["map"]["removed_fog"])
-    state.map.original_image = deserialize_map(data["map"]["image"])
-    state.map.image = pygame.transform.scale(state.map.original_image, data["map"]["image"]["zoom"])
+    state.map.removed_fog = deserialize_fog(data["map"])
+
+    # Show the preview of the background map, if there is one, while the map itself loads
+    state.map.original_image = None
+    if data["map"]["image"] is not None:
+        image_size = tuple(data["map"]["image"]["zoom"])
+        state.map.image_size = image_size
+        if preview is not None:
+            set_map_image(state.map, preview, image_size)
+        _LOADER.load(decode, image_size)
     state.map.camera = tuple(data["map"]["camera"])
     state.map.image_offset = tuple(data["map"]["image_offset"])
-    state.map.pieces = {
-        tuple(piece["place"]): PieceData(
-            parent=tuple(piece["parent"]),
-            place=tuple(piece["place"]),
-            color=tuple(piece["color"]),
-            size=PieceSize(int(piece["size"])),
-            show=piece["show"],
-        )
-        for piece in data["map"]["pieces"]
-    }
-    state.map.markings = {
-        tuple(marking["place"]): MarkingData(
-            place=tuple(marking["place"]),
-            color=tuple(marking["color"]),
-            size=MarkerSize(int(marking["size"])),
-        )
-        for marking in data["map"]["markings"]
-    }
+    clear_pieces(state.map)
+    for piece in data["map"]["pieces"]:
+        # Older save files have the piece repeated for each cell it covers
+        if piece["show"]:
+            place = tuple(piece["parent"])
+            place_piece(Piece(place=place, color=tuple(piece["color"]), size=PieceSize(int(piece["size"]))), state.map)
+    clear_markings(state)
+    for marking in data["map"]["markings"]:
+        add_stroke(deserialize_marking(marking, state.map.gridsize), state)
 
     state.show.grid = data["show"]["grid"]
     state.show.fog = data["show"]["fog"]
 
-    state.colors = [
-        color for color in ORIG_COLORS if color not in {piece["color"] for piece in state.map.pieces.values()}
-    ]
+    # Bring the map up to date with changes made after it was saved, if the program didn't exit cleanly
+    state.map.journal_seq = int(data["map"].get("journal_seq", 0))
+    replay_journal(state)
+
+    state.colors = [color for color in ORIG_COLORS if color not in {piece.color for piece in state.map.pieces}]
+
+
+def read_data_file(
+    path: str,
+) -> tuple[SaveData, pygame.Surface | None, Callable[[], tuple[pygame.Surface, dict[str, EncodedImage]]]]:
+    """Read a save file, the preview of its background map if it has one, and a function to decode the map."""
+    # Older .dndfog files are in the JSON format
+    if is_container(path):
+        data, preview = read_container(path)
+        return data, preview, partial(read_container_image, path, data["map"]["image"])
+
+    with open(path, "r") as f:
+        data: SaveData = json.load(f)
+    return data, None, partial(deserialize_map, data["map"]["image"])
 
 
 def serialize_map(surface: pygame.Surface) -> str:
     return base64.b64encode(gzip.compress(pygame.image.tostring(surface, "RGBA"))).decode()
 
 
-def deserialize_map(data: BackgroundImage) -> pygame.Surface:
-    return pygame.image.fromstring(
+def deserialize_map(data: BackgroundImage) -> tuple[pygame.Surface, dict[str, EncodedImage]]:
+    """Decode the background map from a JSON save file, and keep its encoding to reuse when saving it again."""
+    image = pygame.image.fromstring(
         gzip.decompress(base64.b64decode(data["img"])),
         data["size"],
         data["mode"],
     ).convert_alpha()
+    return image, {"json": encoded_image(data["img"])}
+
+
+def deserialize_fog(data: SaveDataFog) -> FogChunks:
+    if "removed_fog_spans" in data:
+        return FogChunks.from_spans(data["removed_fog_spans"])
+    # Binary save files are read straight into chunks
+    fog = data["removed_fog"]
+    if isinstance(fog, FogChunks):
+        return fog
+    return FogChunks((x, y) for x, y in fog)
+
+
+def deserialize_marking(marking: StrokeData | MarkingData, gridsize: int) -> StrokeData:
+    if "points" in marking:
+        return StrokeData(
+            points=[tuple(point) for point in marking["points"]],
+            size=float(marking["size"]),
+            color=tuple(marking["color"]),
+        )
+
+    # Single pixel markings from older save files
+    return StrokeData(
+        points=[(marking["place"][0] / gridsize, marking["place"][1] / gridsize)],
+        size=int(marking["size"]) / gridsize,
+        color=tuple(marking["color"]),
+    )
 
 
 def get_default_filename(state: ProgramState) -> str:
@@ -0,0 +1,74 @@
+from collections.abc import Hashable
+from math import floor
+
+__all__ = [
+    "SpatialHash",
+]
+
+
+class SpatialHash:
+    """
+    Uniform grid of square buckets, holding keys of objects by the buckets their bounds overlap.
+
+    Bounds are given as (left, top, right, bottom) in the same units as the bucket size.
+    Queries only look at the buckets that overlap the queried bounds, so they cost
+    proportional to what is near the queried area instead of the number of keys.
+    """
+
+    __slots__ = ("_buckets", "_keys", "bucket_size")
+
+    def __init__(self, bucket_size: float) -> None:
+        self.bucket_size = bucket_size
+        self._buckets: dict[tuple[int, int], set[Hashable]] = {}
+        self._keys: dict[Hashable, set[tuple[int, int]]] = {}
+
+    def __contains__(self, key: Hashable) -> bool:
+        return key in self._keys
+
+    def __len__(self) -> int:
+        return len(self._keys)
+
+    def insert(self, key: Hashable, bounds: tuple[float, float, float, float]) -> None:
+        """Add the key to the buckets overlapping the bounds. Can be called again to grow the key's bounds."""
+        buckets = self._keys.setdefault(key, set())
+        first_x, first_y, last_x, last_y = self._bucket_range(bounds)
+        for y in range(first_y, last_y + 1):
+            for x in range(first_x, last_x + 1):
+                if (x, y) not in buckets:
+                    buckets.add((x, y))
+                    self._buckets.setdefault((x, y), set()).add(key)
+
+    def remove(self, key: Hashable) -> None:
+        for bucket in self._keys.pop(key, ()):
+            keys = self._buckets[bucket]
+            keys.discard(key)
+            if not keys:
+                del self._buckets[bucket]
+
+    def query(self, bounds: tuple[float, float, float, float]) -> set[Hashable]:
+        """Get the keys in the buckets overlapping the bounds. Keys might not overlap the bounds themselves."""
+        first_x, first_y, last_x, last_y = self._bucket_range(bounds)
+        found: set[Hashable] = set()
+
+        # Cheaper to look through the buckets that have something in them, if there are fewer of them
+        if (last_x - first_x + 1) * (last_y - first_y + 1) > len(self._buckets):
+            for (x, y), keys in self._buckets.items():
+                if first_x <= x <= last_x and first_y <= y <= last_y:
+                    found.update(keys)
+            return found
+
+        for y in range(first_y, last_y + 1):
+            for x in range(first_x, last_x + 1):
+                keys = self._buckets.get((x, y))
+                if keys is not None:
+                    found.update(keys)
+        return found
+
+    def clear(self) -> None:
+        self._buckets.clear()
+        self._keys.clear()
+
+    def _bucket_range(self, bounds: tuple[float, float, float, float]) -> tuple[int, int, int, int]:
+        left, top, right, bottom = bounds
+        size = self.bucket_size
+        return floor(left / size), floor(top / size), floor(right / size), floor(bottom / size)
@@ -0,0 +1,60 @@
+import sys
+import time
+
+__all__ = [
+    "mark_startup",
+    "report_startup",
+    "start_startup_timer",
+]
+
+
+class StartupTimer:
+    """
+    Measures how long each phase of starting the program takes, from launching it
+    until the map is shown with its background map loaded. Only enabled with `--profile-startup`.
+    """
+
+    def __init__(self) -> None:
+        self.enabled: bool = False
+        self.reported: bool = False
+        self._start: float = 0
+        self._last: float = 0
+        self._phases: dict[str, float] = {}
+
+    def start(self) -> None:
+        self.enabled = True
+        self._start = self._last = time.perf_counter()
+
+    def mark(self, phase: str) -> None:
+        """Mark the end of a phase that started when the previous one ended. Only the first mark of a phase counts."""
+        if not self.enabled or self.reported or phase in self._phases:
+            return
+
+        now = time.perf_counter()
+        self._phases[phase] = now - self._last
+        self._last = now
+
+    def report(self) -> None:
+        if not self.enabled or self.reported:
+            return
+
+        self.reported = True
+        width = max((len(phase) for phase in self._phases), default=0)
+        lines = [f"{phase:<{width}}  {duration * 1000:8.1f} ms" for phase, duration in self._phases.items()]
+        lines.append(f"{'total':<{width}}  {(self._last - self._start) * 1000:8.1f} ms")
+        print("\n".join(lines), file=sys.stderr)  # noqa: T201
+
+
+_STARTUP = StartupTimer()
+
+
+def start_startup_timer() -> None:
+    _STARTUP.start()
+
+
+def mark_startup(phase: str) -> None:
+    _STARTUP.mark(phase)
+
+
+def report_startup() -> None:
+    _STARTUP.report()
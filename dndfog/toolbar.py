@@ -1,5 +1,7 @@
 from typing import overload
 
+import pygame
+
 from dndfog.math import distance_between_points
 from dndfog.types import FogSize, MarkerSize, PieceSize, PlacingKey
 
@@ -11,6 +13,11 @@ _TOOL_OFFSET_CACHE: dict[PlacingKey, int] = {}
 _INDICATOR_CACHE: dict[PlacingKey, int] = {}
 
 
+def toolbar_area(width: int) -> pygame.Rect:
+    """Area of the screen the toolbar is drawn on."""
+    return pygame.Rect(0, 0, width, TOOLBAR_HEIGHT * 2)
+
+
 def get_or_set_offset_cache(key: PlacingKey, offset: int | None) -> int:
     if offset is not None:
         _TOOL_OFFSET_CACHE[key] = offset
@@ -69,7 +76,7 @@ def select_size_tool(mouse_pos: tuple[int, int], selected_size: PieceSize) -> Pi
 
 
 @overload
-def select_size_tool(mouse_pos: tuple[int, int], selected_size: FogSize) -> FogSize:
+def select_size_tool(mouse_pos: tuple[int, int], selected_size: int, enum_type: type[FogSize]) -> int:
     pass
 
 
@@ -78,8 +85,9 @@ def select_size_tool(mouse_pos: tuple[int, int], selected_size: MarkerSize) -> M
     pass
 
 
-def select_size_tool(mouse_pos, selected_size):
-    enum_type = type(selected_size)
+def select_size_tool(mouse_pos, selected_size, enum_type=None):
+    # Sizes that can also be set to values other than the ones in the toolbar need their type given
+    enum_type = enum_type if enum_type is not None else type(selected_size)
     cache_key = _SIZE_KEY_MAP[enum_type]
     placing = get_placing_found_circles(cache_key)
     for (center, radius), size in zip(placing, enum_type.values(), strict=True):
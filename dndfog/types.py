@@ -1,13 +1,22 @@
 import copy
 import enum
+from collections.abc import Iterable, Iterator
 from dataclasses import dataclass, field
+from functools import lru_cache
 from itertools import cycle
-from typing import Literal, NamedTuple, Protocol, TypeAlias, TypedDict
+from typing import Any, Literal, NamedTuple, Protocol, TypeAlias, TypedDict
 
 import pygame
 
-pygame.font.init()
-font = pygame.font.SysFont("arial", 16)
+from dndfog.chunks import FogChunks
+from dndfog.spatial import SpatialHash
+
+
+@lru_cache(maxsize=None)
+def get_font() -> pygame.font.Font:
+    """Font for the texts in the program. Loaded when first needed, since finding system fonts is slow."""
+    pygame.font.init()
+    return pygame.font.SysFont("arial", 16)
 
 
 class Enum(enum.Enum):
@@ -57,6 +66,14 @@ class MouseButtonEvent(Protocol):
     type: int
 
 
+class MouseMotionEvent(Protocol):
+    pos: tuple[int, int]
+    rel: tuple[int, int]
+    buttons: tuple[int, int, int]
+    touch: bool
+    type: int
+
+
 class MouseWheelEvent(Protocol):
     x: int
     y: int
@@ -67,7 +84,12 @@ class MouseWheelEvent(Protocol):
     type: int
 
 
-Event: TypeAlias = KeyEvent | MouseButtonEvent | MouseWheelEvent
+Event: TypeAlias = KeyEvent | MouseButtonEvent | MouseMotionEvent | MouseWheelEvent
+
+RGBAColor: TypeAlias = pygame.Color | tuple[int, int, int, int]
+
+GLOW_CACHE_SIZE: int = 64
+"""How many differently shaped or colored glows to keep built at the same time."""
 
 
 class Glow:
@@ -139,6 +161,24 @@ class Glow:
         return glow
 
 
+def get_glow(radius_range: range, inner_color: RGBAColor, outer_color: RGBAColor) -> Glow:
+    """
+    Get a glow for the given radius range and colors.
+    Glows are expensive to build, so they are shared between all callers
+    and the least recently used ones are evicted when the cache gets full.
+    """
+    return _build_cached_glow(radius_range, tuple(inner_color), tuple(outer_color))
+
+
+@lru_cache(maxsize=GLOW_CACHE_SIZE)
+def _build_cached_glow(
+    radius_range: range,
+    inner_color: tuple[int, int, int, int],
+    outer_color: tuple[int, int, int, int],
+) -> Glow:
+    return Glow(radius_range, pygame.Color(*inner_color), pygame.Color(*outer_color))
+
+
 class PieceSize(int, Enum):
     small = 1
     medium = 2
@@ -147,12 +187,25 @@ class PieceSize(int, Enum):
 
 
 class FogSize(int, Enum):
+    """Fog brush sizes that can be picked from the toolbar. Other sizes up to `MAX_FOG_SIZE` can be scrolled to."""
+
     small = 1
     medium = 2
     large = 3
     giant = 4
 
 
+MAX_FOG_SIZE: int = 50
+"""Largest width and height of the fog brush, in grid cells."""
+
+
+class FogShape(int, Enum):
+    square = 0
+    circle = 1
+    line = 2
+    """Row of cells as wide as the brush."""
+
+
 class MarkerSize(int, Enum):
     small = 3
     medium = 5
@@ -161,6 +214,11 @@ class MarkerSize(int, Enum):
 
 
 class PieceData(TypedDict):
+    """
+    Piece in save files. Older save files have one for each cell a piece covers,
+    with `show` set only for the top left cell.
+    """
+
     place: Coordinate
     parent: Coordinate
     color: ColorTuple
@@ -169,13 +227,50 @@ class PieceData(TypedDict):
 
 
 class MarkingData(TypedDict):
+    """Single pixel marking, used in save files before markings were saved as strokes."""
+
     place: Coordinate
     size: MarkerSize
     color: ColorTuple
 
 
-Pieces: TypeAlias = dict[Coordinate, PieceData]
-Markings: TypeAlias = dict[Coordinate, MarkingData]
+class StrokeData(TypedDict):
+    points: list[tuple[float, float]]
+    """Points of the stroke on the grid, in grid cells."""
+    size: float
+    """Radius of the stroke, in grid cells."""
+    color: ColorTuple
+
+
+class Piece:
+    """Piece on the grid, covering a square of cells starting from its top left cell."""
+
+    __slots__ = ("place", "color", "size")
+
+    def __init__(self, place: Coordinate, color: ColorTuple, size: PieceSize) -> None:
+        self.place = place
+        self.color = color
+        self.size = size
+
+    def cells(self, place: Coordinate | None = None) -> Iterator[Coordinate]:
+        """Cells covered by the piece, or by the piece if it were moved to the given place."""
+        x, y = place if place is not None else self.place
+        for dx in range(self.size.value):
+            for dy in range(self.size.value):
+                yield x + dx, y + dy
+
+    def to_json(self) -> PieceData:
+        return PieceData(
+            parent=self.place,
+            place=self.place,
+            color=self.color,
+            size=self.size,
+            show=True,
+        )
+
+
+Occupancy: TypeAlias = dict[Coordinate, Piece]
+Markings: TypeAlias = dict[int, StrokeData]
 
 
 class Tool(int, Enum):
@@ -190,6 +285,7 @@ class PlacingKey(str, Enum):
     grid_checkbox = "grid_checkbox"
     fog_checkbox = "fog_checkbox"
     fog_size = "fog_size"
+    fog_shape = "fog_shape"
     piece_size = "piece_size"
     clear_markings = "markings_clear"
     marker_size = "marker_size"
@@ -209,16 +305,27 @@ class SaveDataShow(TypedDict):
     toolbar: bool
 
 
-class SaveDataMap(TypedDict):
+FogSpan: TypeAlias = tuple[int, int, int]
+"""Row of consecutive cells as (x, y, length)."""
+
+
+class SaveDataFog(TypedDict, total=False):
+    removed_fog_spans: list[FogSpan]
+    """Revealed cells in JSON save files."""
+    removed_fog: Iterable[Coordinate]
+    """Revealed cells in older JSON save files, and as read from binary save files."""
+
+
+class SaveDataMap(SaveDataFog):
     gridsize: int
     camera: Coordinate
     image: BackgroundImage
     image_offset: tuple[float, float]
     pieces: list[PieceData]
-    removed_fog: list[Coordinate]
-    markings: list[MarkingData]
+    markings: list[StrokeData]
     fog_color: ColorTuple
     grid_color: ColorTuple
+    journal_seq: int
 
 
 class SaveData(TypedDict):
@@ -231,6 +338,8 @@ class Show:
     grid: bool = False
     fog: bool = False
     toolbar: bool = False
+    profiler: bool = False
+    """Not saved, since it's only for finding out why the program is slow."""
 
     def to_json(self) -> SaveDataShow:
         return SaveDataShow(
@@ -245,54 +354,189 @@ class Selected:
     tool: Tool = Tool.piece
     piece: Coordinate | None = None
     piece_size: PieceSize = PieceSize.small
-    fog: FogSize = FogSize.small
+    fog: int = FogSize.small
+    """Width and height of the fog brush in grid cells."""
+    fog_shape: FogShape = FogShape.square
     marker_size: MarkerSize = MarkerSize.small
     marker_color: ColorTuple = (0x00, 0x00, 0x00)
     indicator: PlacingKey | None = None
+    fog_cell: Coordinate | None = None
+    """Top left cell of the fog brush when fog was last added or removed while dragging."""
+
+
+MARKINGS_BUCKET_SIZE: int = 4
+"""Width and height of the buckets in the spatial index of markings, in grid cells."""
+
+
+PIECES_BUCKET_SIZE: int = 8
+"""Width and height of the buckets in the spatial index of pieces, in grid cells."""
+
+
+@dataclass
+class MarkingsLayer:
+    """Markings drawn on a transparent surface that is kept between frames."""
+
+    surface: pygame.Surface | None = None
+    camera: Coordinate = (0, 0)
+    gridsize: int = 0
+    segments: list[tuple[StrokeData, int]] = field(default_factory=list)
+    """New points of strokes to draw on top of the layer, as strokes and indices of the points."""
+    damaged: list[pygame.Rect] = field(default_factory=list)
+    """Areas of the layer to draw again from all strokes."""
+
+    def invalidate(self) -> None:
+        """Draw all strokes again on the next frame."""
+        self.surface = None
+        self.segments.clear()
+        self.damaged.clear()
+
+
+@dataclass
+class FogLayer:
+    """Fog drawn on a surface that is kept between frames, and patched where the fog changes."""
+
+    surface: pygame.Surface | None = None
+    view: tuple[Any, ...] = ()
+    """Cells the layer covers, and the size and color they are drawn in."""
+    fog: FogChunks | None = None
+    version: int = 0
+    """Version of the fog the layer was last drawn from."""
+
+    def invalidate(self) -> None:
+        """Draw the whole layer again on the next frame."""
+        self.surface = None
+
+
+@dataclass(frozen=True)
+class EncodedImage:
+    """Background map encoded for a save file, kept so that the same map isn't encoded again on every save."""
+
+    data: bytes | str
+    sha256: str
+    """Hash of the encoded data, which identifies the background map."""
 
 
 @dataclass
 class MapData:
     gridsize: int = 36
     camera: Coordinate = (0, 0)
-    image: pygame.Surface | None = None
+    image_size: tuple[int, int] = (0, 0)
+    """Size of the background map at the current zoom level."""
     original_image: pygame.Surface | None = None
+    mipmaps: list[pygame.Surface] = field(default_factory=list)
+    encoded_image: dict[str, EncodedImage] = field(default_factory=dict)
+    """Encodings of the original image by save file format. Replaced when the image is replaced."""
     image_offset: tuple[float, float] = (0, 0)
-    pieces: Pieces = field(default_factory=dict)
-    removed_fog: set[Coordinate] = field(default_factory=set)
+    pieces: set[Piece] = field(default_factory=set)
+    occupancy: Occupancy = field(default_factory=dict)
+    """Pieces by the cells they cover."""
+    pieces_index: SpatialHash = field(default_factory=lambda: SpatialHash(PIECES_BUCKET_SIZE))
+    """Pieces by the area of the grid they cover."""
+    removed_fog: FogChunks = field(default_factory=FogChunks)
     markings: Markings = field(default_factory=dict)
-    last_marking: Coordinate | None = None
+    markings_index: SpatialHash = field(default_factory=lambda: SpatialHash(MARKINGS_BUCKET_SIZE))
+    """Stroke IDs by the area of the grid they cover."""
+    stroke: int | None = None
+    """The stroke currently being drawn."""
+    markings_layer: MarkingsLayer = field(default_factory=MarkingsLayer)
+    fog_layer: FogLayer = field(default_factory=FogLayer)
     fog_color: ColorTuple = (0xCC, 0xCC, 0xCC)
     grid_color: ColorTuple = (0xC5, 0xC5, 0xC5)
+    journal_seq: int = 0
+    """Number of the last change to the map written to the journal."""
+
+    def snapshot(self) -> "MapData":
+        """
+        Copy of the saved parts of the map, that can be saved while the map keeps changing.
+        The background map is not copied, since it's replaced instead of changed.
+        The stroke being drawn is left out, since it's journaled as a whole when it's finished.
+        """
+        return MapData(
+            gridsize=self.gridsize,
+            camera=self.camera,
+            image_size=self.image_size,
+            original_image=self.original_image,
+            # Shared, so that the image only needs to be encoded once, even if it's encoded for a snapshot
+            encoded_image=self.encoded_image,
+            image_offset=self.image_offset,
+            pieces={Piece(place=piece.place, color=piece.color, size=piece.size) for piece in self.pieces},
+            removed_fog=self.removed_fog.copy(),
+            markings={
+                stroke_id: StrokeData(points=list(stroke["points"]), size=stroke["size"], color=stroke["color"])
+                for stroke_id, stroke in self.markings.items()
+                if stroke_id != self.stroke
+            },
+            fog_color=self.fog_color,
+            grid_color=self.grid_color,
+            journal_seq=self.journal_seq,
+        )
 
     def to_json(self) -> SaveDataMap:
+        from dndfog.map import encode_map_image
         from dndfog.saving import serialize_map
 
         return SaveDataMap(
             gridsize=self.gridsize,
             camera=self.camera,
             image=BackgroundImage(
-                img=serialize_map(self.original_image),
+                img=encode_map_image(self, "json", serialize_map).data,
                 size=self.original_image.get_size(),
                 mode="RGBA",
-                zoom=self.image.get_size(),
+                zoom=self.image_size,
             ),
             image_offset=self.image_offset,
-            pieces=list(self.pieces.values()),
-            removed_fog=list(self.removed_fog),
+            pieces=[piece.to_json() for piece in self.pieces],
+            removed_fog_spans=list(self.removed_fog.spans()),
             markings=list(self.markings.values()),
             fog_color=self.fog_color,
             grid_color=self.grid_color,
+            journal_seq=self.journal_seq,
         )
 
 
+@dataclass
+class Redraw:
+    """Parts of the screen that need to be drawn again on the next frame."""
+
+    full: bool = True
+    areas: list[pygame.Rect] = field(default_factory=list)
+    skipped: int = 0
+    """How many frames have been skipped since there was nothing new to draw."""
+    idle: int = 0
+    """How many times the loop has waited for new events, since there was nothing to do."""
+
+    @property
+    def pending(self) -> bool:
+        return self.full or len(self.areas) > 0
+
+    def everything(self) -> None:
+        self.full = True
+        self.areas.clear()
+
+    def area(self, rect: pygame.Rect) -> None:
+        if not self.full:
+            self.areas.append(rect)
+
+    def clear(self) -> None:
+        self.full = False
+        self.areas.clear()
+
+
 @dataclass
 class ProgramState:
     show: Show = field(default_factory=Show)
     selected: Selected = field(default_factory=Selected)
     colors: list[ColorTuple] = field(default_factory=ORIG_COLORS.copy)
     map: MapData = field(default_factory=MapData)
+    redraw: Redraw = field(default_factory=Redraw)
     file: str | None = None
+    message: str | None = None
+    """Message shown to the user, like a warning about a failed save. See `dndfog.messages`."""
+    message_until: float = 0
+
+    def snapshot(self) -> "ProgramState":
+        """Copy of the saved parts of the program state. See `MapData.snapshot`."""
+        return ProgramState(show=copy.copy(self.show), map=self.map.snapshot(), file=self.file)
 
     def to_json(self) -> SaveData:
         return {
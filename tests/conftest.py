@@ -0,0 +1,52 @@
+import os
+
+os.environ.setdefault("SDL_VIDEODRIVER", "dummy")
+
+import pygame
+import pytest
+
+from dndfog.chunks import FogChunks
+from dndfog.map import set_map_image
+from dndfog.markings import add_stroke
+from dndfog.piece import place_piece
+from dndfog.types import Piece, PieceSize, ProgramState, StrokeData
+
+
+@pytest.fixture(scope="session")
+def display() -> pygame.Surface:
+    pygame.init()
+    surface = pygame.display.set_mode((200, 200))
+    yield surface
+    pygame.quit()
+
+
+@pytest.fixture
+def state(display, tmp_path) -> ProgramState:
+    """Map with a background image, fog, pieces and markings, to be saved to a file in a temporary directory."""
+    state = ProgramState(file=str(tmp_path / "map.dndfog"))
+
+    image = pygame.Surface((300, 200), flags=pygame.SRCALPHA)
+    image.fill((10, 20, 30, 255))
+    image.fill((200, 100, 50, 128), (50, 50, 40, 40))
+    set_map_image(state.map, image.convert_alpha(), (600, 400))
+
+    state.map.gridsize = 40
+    state.map.camera = (12, -7)
+    state.map.image_offset = (0.5, -1.25)
+    state.show.grid = True
+
+    fog = FogChunks()
+    # Full chunk, rows across chunk borders, and negative coordinates
+    for y in range(64):
+        fog.add_span(0, y, 64)
+    fog.add_span(60, 70, 10)
+    fog.add_span(-5, -3, 8)
+    fog.add((200, -100))
+    state.map.removed_fog = fog
+
+    place_piece(Piece(place=(1, 2), color=(255, 0, 0), size=PieceSize.small), state.map)
+    place_piece(Piece(place=(-4, 5), color=(0, 255, 0), size=PieceSize.large), state.map)
+
+    add_stroke(StrokeData(points=[(1.5, 2.25), (3.0, 4.0)], size=0.25, color=(1, 2, 3)), state)
+    add_stroke(StrokeData(points=[(-2.0, 0.5)], size=0.5, color=(4, 5, 6)), state)
+    return state
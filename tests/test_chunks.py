@@ -0,0 +1,198 @@
+import random
+
+import pytest
+
+from dndfog.chunks import CHANGE_LOG_SIZE, CHUNK_SIZE, FogChunks
+
+
+def cells_of_spans(spans):
+    return {(x + i, y) for x, y, length in spans for i in range(length)}
+
+
+def test_add_span__across_chunk_border():
+    fog = FogChunks()
+    fog.add_span(CHUNK_SIZE - 3, 5, 6)
+
+    assert set(fog) == {(x, 5) for x in range(CHUNK_SIZE - 3, CHUNK_SIZE + 3)}
+    assert len(fog) == 6
+    assert sorted(fog.spans()) == [(CHUNK_SIZE - 3, 5, 3), (CHUNK_SIZE, 5, 3)]
+
+
+def test_add_span__negative_coordinates():
+    fog = FogChunks()
+    fog.add_span(-3, -1, 6)
+
+    assert set(fog) == {(x, -1) for x in range(-3, 3)}
+    assert (-1, -1) in fog
+    assert (-4, -1) not in fog
+    assert (0, 0) not in fog
+
+
+def test_add_span__overlapping():
+    fog = FogChunks()
+    fog.add_span(0, 0, 10)
+    fog.add_span(5, 0, 10)
+
+    assert len(fog) == 15
+
+
+def test_discard_span__across_chunk_border():
+    fog = FogChunks()
+    fog.add_span(-10, 0, 20)
+    fog.discard_span(-2, 0, 4)
+
+    assert set(fog) == {(x, 0) for x in range(-10, 10)} - {(-2, 0), (-1, 0), (0, 0), (1, 0)}
+    assert len(fog) == 16
+
+
+def test_discard_span__removes_empty_chunks():
+    fog = FogChunks()
+    fog.add_span(60, 0, 10)
+    fog.discard_span(60, 0, 10)
+
+    assert len(fog) == 0
+    assert fog.to_chunks() == ([], {})
+
+
+def test_spans__random_against_set():
+    rng = random.Random(0)
+    fog = FogChunks()
+    reference = set()
+    for _ in range(500):
+        x, y, length = rng.randrange(-150, 150), rng.randrange(-100, 100), rng.randrange(1, 80)
+        cells = cells_of_spans([(x, y, length)])
+        if rng.random() < 0.6:
+            fog.add_span(x, y, length)
+            reference |= cells
+        else:
+            fog.discard_span(x, y, length)
+            reference -= cells
+
+    assert set(fog) == reference
+    assert len(fog) == len(reference)
+    assert cells_of_spans(fog.spans()) == reference
+    assert set(FogChunks.from_spans(fog.spans())) == reference
+    assert set(FogChunks.from_chunks(*fog.to_chunks())) == reference
+
+
+def test_full_chunk():
+    fog = FogChunks()
+    for y in range(-CHUNK_SIZE, 0):
+        fog.add_span(-CHUNK_SIZE, y, CHUNK_SIZE)
+
+    full, chunks = fog.to_chunks()
+    assert full == [(-1, -1)]
+    assert chunks == {}
+    assert len(fog) == CHUNK_SIZE * CHUNK_SIZE
+    assert (-1, -1) in fog
+    assert (-CHUNK_SIZE, -CHUNK_SIZE) in fog
+    assert list(fog.spans())[0] == (-CHUNK_SIZE, -CHUNK_SIZE, CHUNK_SIZE)
+
+
+def test_full_chunk__add_does_nothing():
+    fog = FogChunks()
+    for y in range(CHUNK_SIZE):
+        fog.add_span(0, y, CHUNK_SIZE)
+    version = fog.version
+
+    fog.add((3, 3))
+    fog.add_span(0, 0, CHUNK_SIZE)
+
+    assert fog.version == version
+    assert len(fog) == CHUNK_SIZE * CHUNK_SIZE
+
+
+@pytest.mark.parametrize("remove", ["discard", "discard_span"])
+def test_full_chunk__removing_a_cell(remove):
+    fog = FogChunks()
+    for y in range(CHUNK_SIZE):
+        fog.add_span(0, y, CHUNK_SIZE)
+
+    if remove == "discard":
+        fog.discard((3, 4))
+    else:
+        fog.discard_span(3, 4, 1)
+
+    full, chunks = fog.to_chunks()
+    assert full == []
+    assert list(chunks) == [(0, 0)]
+    assert (3, 4) not in fog
+    assert (4, 4) in fog
+    assert len(fog) == CHUNK_SIZE * CHUNK_SIZE - 1
+
+    fog.add((3, 4))
+    assert fog.to_chunks() == ([(0, 0)], {})
+
+
+def test_region():
+    fog = FogChunks()
+    for y in range(CHUNK_SIZE):
+        fog.add_span(0, y, CHUNK_SIZE)
+    fog.add((-1, 2))
+
+    region = fog.region(-2, 1, 4, 3)
+
+    assert region == bytearray([0, 0, 1, 1, 0, 1, 1, 1, 0, 0, 1, 1])
+
+
+def test_version__changes_only_when_cells_change():
+    fog = FogChunks()
+    versions = [fog.version]
+
+    fog.add((1, 1))
+    versions.append(fog.version)
+    fog.add((1, 1))
+    fog.discard((2, 2))
+    fog.discard_span(10, 10, 5)
+    assert fog.version == versions[-1]
+
+    fog.add_span(0, 1, 3)
+    versions.append(fog.version)
+    fog.discard_span(0, 1, 1)
+    versions.append(fog.version)
+    fog.discard((1, 1))
+    versions.append(fog.version)
+    fog.clear()
+    versions.append(fog.version)
+
+    assert versions == sorted(set(versions))
+
+
+def test_version__unique_between_sets():
+    fog = FogChunks()
+    other = fog.copy()
+
+    assert other.version != fog.version
+    fog.add((0, 0))
+    assert (0, 0) not in other
+
+
+def test_changed_area():
+    fog = FogChunks()
+    fog.add_span(0, 0, 5)
+    version = fog.version
+
+    assert fog.changed_area(version) == (0, 0, 0, 0)
+
+    fog.add_span(-3, 10, 2)
+    fog.discard((4, 0))
+    fog.add((0, 0))
+
+    assert fog.changed_area(version) == (-3, 0, 8, 11)
+
+
+def test_changed_area__unknown():
+    fog = FogChunks()
+    fog.add((0, 0))
+    version = fog.version
+    other = FogChunks()
+
+    assert fog.changed_area(other.version) is None
+
+    fog.clear()
+    assert fog.changed_area(version) is None
+
+    version = fog.version
+    for x in range(CHANGE_LOG_SIZE + 1):
+        fog.add((x, 0))
+    assert fog.changed_area(version) is None
@@ -0,0 +1,104 @@
+import pytest
+
+from dndfog.fog import fog_brush_cell, fog_brush_spans, fog_stroke_spans
+from dndfog.markings import interpolate_line
+from dndfog.types import MAX_FOG_SIZE, FogShape
+
+
+def cells_of_spans(spans):
+    return {(x + i, y) for x, y, length in spans for i in range(length)}
+
+
+@pytest.mark.parametrize("gridsize", [5, 6, 11, 35, 40])
+@pytest.mark.parametrize("size", [1, 3, 9, 49])
+def test_fog_brush_cell__centered_on_cell(gridsize, size):
+    camera = (-123, 47)
+    cell = (7, -3)
+    # Middle of the cell on the screen
+    offset = gridsize // 2
+    mouse_pos = (cell[0] * gridsize - camera[0] + offset, cell[1] * gridsize - camera[1] + offset)
+
+    left, top = fog_brush_cell(mouse_pos, camera, gridsize, size)
+
+    assert (left + size // 2, top + size // 2) == cell
+
+
+@pytest.mark.parametrize("gridsize", [5, 6, 11, 35, 40])
+@pytest.mark.parametrize("size", [2, 4, 10, MAX_FOG_SIZE])
+def test_fog_brush_cell__centered_on_corner(gridsize, size):
+    camera = (-123, 47)
+    cell = (7, -3)
+    # Bottom right quarter of the cell on the screen, so its bottom right corner is the nearest one
+    offset = gridsize * 3 // 4
+    mouse_pos = (cell[0] * gridsize - camera[0] + offset, cell[1] * gridsize - camera[1] + offset)
+
+    left, top = fog_brush_cell(mouse_pos, camera, gridsize, size)
+
+    assert (left + size // 2, top + size // 2) == (cell[0] + 1, cell[1] + 1)
+
+
+def test_fog_brush_cell__size_one_is_cell_under_mouse():
+    assert fog_brush_cell((45, 85), (0, 0), 40, 1) == (1, 2)
+    assert fog_brush_cell((45, 85), (-100, 20), 40, 1) == (-2, 2)
+
+
+@pytest.mark.parametrize("size", [1, 2, 5, 10, MAX_FOG_SIZE])
+def test_fog_brush_spans__square(size):
+    spans = fog_brush_spans(size, FogShape.square)
+
+    assert cells_of_spans(spans) == {(x, y) for x in range(size) for y in range(size)}
+
+
+def test_fog_brush_spans__line():
+    assert fog_brush_spans(1, FogShape.line) == ((0, 0, 1),)
+    assert fog_brush_spans(5, FogShape.line) == ((0, 2, 5),)
+    assert fog_brush_spans(6, FogShape.line) == ((0, 2, 6),)
+
+
+def test_fog_brush_spans__circle():
+    assert fog_brush_spans(1, FogShape.circle) == ((0, 0, 1),)
+    assert fog_brush_spans(5, FogShape.circle) == ((1, 0, 3), (0, 1, 5), (0, 2, 5), (0, 3, 5), (1, 4, 3))
+
+
+@pytest.mark.parametrize("size", [2, 3, 8, 13, MAX_FOG_SIZE])
+def test_fog_brush_spans__circle_shape(size):
+    spans = fog_brush_spans(size, FogShape.circle)
+    cells = cells_of_spans(spans)
+
+    # One row at most for each row of the brush, inside the brush's square and symmetric around its middle
+    assert len({y for _, y, _ in spans}) == len(spans)
+    assert all(0 <= x < size and 0 <= y < size for x, y in cells)
+    assert cells == {(size - 1 - x, y) for x, y in cells}
+    assert cells == {(x, size - 1 - y) for x, y in cells}
+    assert cells == {(y, x) for x, y in cells}
+    # The middle row is as wide as the brush
+    assert (0, size // 2, size) in spans
+
+
+def test_fog_stroke_spans__without_start():
+    spans = fog_stroke_spans(None, (10, -4), 3, FogShape.square)
+
+    assert sorted(spans, key=lambda span: span[1]) == [(10, -4, 3), (10, -3, 3), (10, -2, 3)]
+
+
+@pytest.mark.parametrize("shape", list(FogShape))
+@pytest.mark.parametrize(("start", "end"), [((0, 0), (9, 0)), ((-5, 8), (4, -3)), ((2, 2), (2, -20)), ((3, 1), (3, 1))])
+def test_fog_stroke_spans__covers_brush_along_line(shape, start, end):
+    size = 4
+    spans = fog_stroke_spans(start, end, size, shape)
+
+    # Every cell is in one row at most
+    assert sum(length for _, _, length in spans) == len(cells_of_spans(spans))
+
+    # The brush is stamped at every cell on the line between start and end, without gaps
+    line = list(interpolate_line(start, end))
+    assert {start, end} <= set(line)
+    assert len(line) == max(abs(end[0] - start[0]), abs(end[1] - start[1])) + 1
+    brush = cells_of_spans(fog_brush_spans(size, shape))
+    assert cells_of_spans(spans) == {(x + dx, y + dy) for x, y in line for dx, dy in brush}
+
+
+def test_fog_stroke_spans__merges_overlapping_rows():
+    spans = fog_stroke_spans((0, 0), (5, 0), 2, FogShape.square)
+
+    assert sorted(spans, key=lambda span: span[1]) == [(0, 0, 7), (0, 1, 7)]
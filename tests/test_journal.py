@@ -0,0 +1,187 @@
+import json
+import os
+
+import pytest
+
+from dndfog.fog import remove_fog
+from dndfog.event_handlers import handle_left_mouse_button_up
+from dndfog.journal import _JOURNAL, compact_journal, flush_journal, journal_path, record_change, replay_journal
+from dndfog.markings import add_markings, add_stroke
+from dndfog.piece import add_piece
+from dndfog.saving import (
+    autosave_path,
+    finish_loading_map,
+    load_map,
+    save_data_file,
+    wait_for_saves,
+    write_data_file,
+)
+from dndfog.types import PieceSize, ProgramState, StrokeData
+
+
+@pytest.fixture(autouse=True)
+def _reset_journal():
+    yield
+    _JOURNAL.reset()
+    _JOURNAL.disabled = False
+
+
+def load(path: str) -> ProgramState:
+    state = ProgramState()
+    load_map(path, state)
+    finish_loading_map(state, wait=True)
+    return state
+
+
+def journal_seqs(file: str) -> list[int]:
+    with open(journal_path(file)) as f:
+        return [json.loads(line)["seq"] for line in f]
+
+
+def reveal(state: ProgramState, spans: list[tuple[int, int, int]]) -> None:
+    remove_fog(state.map.removed_fog, spans)
+    record_change(state, "remove_fog", spans=spans)
+
+
+def draw_stroke(state: ProgramState, x: float) -> None:
+    stroke = StrokeData(points=[(x, 1.0), (x + 1, 2.0)], size=0.25, color=(9, 8, 7))
+    add_stroke(stroke, state)
+    record_change(state, "stroke", points=stroke["points"], size=stroke["size"], color=stroke["color"])
+
+
+def test_journal__replayed_on_load(state):
+    write_data_file(state)
+    replay_journal(state)
+
+    reveal(state, [(100, 100, 5)])
+    piece = add_piece((20, 20), state.map, state.colors, PieceSize.medium)
+    record_change(state, "add_piece", place=piece.place, color=piece.color, size=piece.size.value)
+    draw_stroke(state, 30)
+    flush_journal(state)
+
+    loaded = load(state.file)
+
+    assert loaded.map.journal_seq == state.map.journal_seq == 3
+    assert set(loaded.map.removed_fog) == set(state.map.removed_fog)
+    assert {(p.place, p.color, p.size) for p in loaded.map.pieces} == {(p.place, p.color, p.size) for p in state.map.pieces}
+    assert len(loaded.map.markings) == len(state.map.markings)
+
+
+def test_journal__changes_included_in_save_not_replayed(state):
+    write_data_file(state)
+    replay_journal(state)
+
+    draw_stroke(state, 30)
+    flush_journal(state)
+    # Saving without compacting the journal, like when the program exits before the save has finished
+    write_data_file(state)
+    draw_stroke(state, 40)
+    flush_journal(state)
+
+    assert journal_seqs(state.file) == [1, 2]
+    loaded = load(state.file)
+
+    assert loaded.map.journal_seq == 2
+    assert sorted(stroke["points"][0][0] for stroke in loaded.map.markings.values())[-2:] == [30, 40]
+    assert len(loaded.map.markings) == len(state.map.markings)
+
+
+def test_journal__older_fog_changes_with_cells(state):
+    write_data_file(state)
+    with open(journal_path(state.file), "w") as f:
+        f.write(json.dumps({"seq": 1, "op": "remove_fog", "cells": [[500, 500], [501, 500]]}) + "\n")
+        f.write(json.dumps({"seq": 2, "op": "add_fog", "cells": [[500, 500]]}) + "\n")
+
+    loaded = load(state.file)
+
+    assert (501, 500) in loaded.map.removed_fog
+    assert (500, 500) not in loaded.map.removed_fog
+
+
+def test_journal__incomplete_last_line(state):
+    write_data_file(state)
+    replay_journal(state)
+    reveal(state, [(100, 100, 1)])
+    flush_journal(state)
+    with open(journal_path(state.file), "a") as f:
+        f.write('{"seq": 2, "op": "remove_fo')
+
+    loaded = load(state.file)
+
+    assert loaded.map.journal_seq == 1
+    assert (100, 100) in loaded.map.removed_fog
+
+
+def test_journal__saved_while_drawing_a_stroke(state):
+    write_data_file(state)
+    replay_journal(state)
+    markings = len(state.map.markings)
+
+    add_markings((100, 100), state)
+    add_markings((120, 110), state)
+    save_data_file(state)
+    wait_for_saves()
+    add_markings((140, 130), state)
+    handle_left_mouse_button_up(None, None, state)
+    flush_journal(state)
+
+    loaded = load(state.file)
+
+    assert len(state.map.markings) == markings + 1
+    assert len(loaded.map.markings) == markings + 1
+    assert sorted(len(stroke["points"]) for stroke in loaded.map.markings.values()) == sorted(
+        len(stroke["points"]) for stroke in state.map.markings.values()
+    )
+
+
+def test_compact_journal(state):
+    write_data_file(state)
+    replay_journal(state)
+    for x in range(3):
+        reveal(state, [(100 + x, 100, 1)])
+    flush_journal(state)
+
+    compact_journal(state.file, 2)
+    assert journal_seqs(state.file) == [3]
+
+    compact_journal(state.file, 3)
+    assert not os.path.exists(journal_path(state.file))
+
+
+def test_journal__not_written_disables_journaling(state):
+    # A directory can't be opened for writing, like a file in a folder without write permissions
+    os.mkdir(journal_path(state.file))
+    reveal(state, [(100, 100, 1)])
+    flush_journal(state)
+
+    assert _JOURNAL.disabled
+    assert state.message is not None
+
+    reveal(state, [(101, 100, 1)])
+    flush_journal(state)
+    assert state.map.journal_seq == 1
+
+
+def test_autosave__used_when_newer(state):
+    write_data_file(state)
+    replay_journal(state)
+    draw_stroke(state, 30)
+    flush_journal(state)
+    write_data_file(state, autosave_path(state.file))
+    compact_journal(state.file, state.map.journal_seq)
+    draw_stroke(state, 40)
+    flush_journal(state)
+
+    loaded = load(state.file)
+
+    assert loaded.map.journal_seq == 2
+    assert len(loaded.map.markings) == len(state.map.markings)
+
+
+def test_autosave__removed_on_save(state):
+    write_data_file(state, autosave_path(state.file))
+    assert os.path.exists(autosave_path(state.file))
+
+    write_data_file(state)
+
+    assert not os.path.exists(autosave_path(state.file))
@@ -0,0 +1,62 @@
+import csv
+
+import pytest
+
+from dndfog.draw import draw
+from dndfog.profiler import (
+    PROFILER_COUNTERS,
+    PROFILER_STAGES,
+    enable_profiling,
+    end_profiled_frame,
+    mark_stage,
+    set_profiler_csv,
+    start_profiled_frame,
+)
+from dndfog.types import LoopData, ProgramState
+
+
+@pytest.fixture(autouse=True)
+def _reset_profiler():
+    yield
+    enable_profiling(enabled=False)
+    set_profiler_csv(None)
+
+
+def test_profiler_csv__counters(tmp_path):
+    path = str(tmp_path / "profile.csv")
+    enable_profiling(enabled=True)
+    set_profiler_csv(path)
+
+    for skipped, idle in [(0, 0), (1, 0), (1, 3)]:
+        start_profiled_frame()
+        mark_stage("events")
+        end_profiled_frame(skipped=skipped, idle=idle)
+    set_profiler_csv(None)
+
+    with open(path) as f:
+        rows = list(csv.reader(f))
+
+    assert rows[0] == ["frame", "time", *PROFILER_STAGES, *PROFILER_COUNTERS]
+    assert [row[-2:] for row in rows[1:]] == [["0", "0"], ["1", "0"], ["1", "3"]]
+    # Stages that didn't happen are left empty
+    assert all(row[2] and not row[3] for row in rows[1:])
+
+
+def test_draw__counts_skipped_frames(display):
+    state = ProgramState()
+    loop = LoopData(
+        mouse_pos=(0, 0),
+        grid_pos=(0, 0),
+        mouse_speed=(0, 0),
+        pressed_modifiers=0,
+        pressed_buttons=(False, False, False),
+    )
+
+    draw(display, loop, state)
+    draw(display, loop, state)
+    draw(display, loop, state)
+    assert state.redraw.skipped == 2
+
+    state.redraw.everything()
+    draw(display, loop, state)
+    assert state.redraw.skipped == 2
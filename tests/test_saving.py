@@ -0,0 +1,211 @@
+import json
+import zipfile
+
+import pygame
+import pytest
+
+from dndfog.chunks import FogChunks
+from dndfog.container import (
+    is_container,
+    pack_fog,
+    pack_markings,
+    pack_pieces,
+    read_container,
+    unpack_fog,
+    unpack_markings,
+    unpack_pieces,
+    write_container,
+)
+from dndfog.saving import finish_loading_map, load_map, serialize_map, write_data_file, zoom_loading_map
+from dndfog.types import PieceSize, ProgramState
+
+
+def load(path: str) -> ProgramState:
+    state = ProgramState()
+    load_map(path, state)
+    finish_loading_map(state, wait=True)
+    return state
+
+
+def saved_parts(state: ProgramState) -> dict:
+    """The parts of the program state that are saved, in a form that can be compared."""
+    return {
+        "gridsize": state.map.gridsize,
+        "camera": tuple(state.map.camera),
+        "image_offset": tuple(state.map.image_offset),
+        "image_size": tuple(state.map.image_size),
+        "image": pygame.image.tobytes(state.map.original_image, "RGBA"),
+        "fog": set(state.map.removed_fog),
+        "pieces": {(piece.place, piece.color, piece.size) for piece in state.map.pieces},
+        "markings": sorted(
+            (tuple(map(tuple, stroke["points"])), stroke["size"], tuple(stroke["color"]))
+            for stroke in state.map.markings.values()
+        ),
+        "show": (state.show.grid, state.show.fog),
+    }
+
+
+def test_container__round_trip(state):
+    write_data_file(state)
+
+    assert is_container(state.file)
+    assert saved_parts(load(state.file)) == saved_parts(state)
+
+
+def test_container__contents(state):
+    write_container(state.file, state)
+
+    with zipfile.ZipFile(state.file) as archive:
+        names = set(archive.namelist())
+    assert {"meta.json", "image.rgba.zlib", "preview.rgba", "fog_full.bin", "fog_chunks.bin"} <= names
+    assert {"pieces.bin", "markings.bin"} <= names
+
+    data, preview = read_container(state.file)
+    assert data["map"]["gridsize"] == 40
+    assert data["map"]["image"]["size"] == [300, 200]
+    assert preview is not None
+    assert max(preview.get_size()) <= 256
+
+
+def test_container__without_background_map(display, tmp_path):
+    state = ProgramState(file=str(tmp_path / "empty.dndfog"))
+    state.map.removed_fog.add((3, 4))
+    write_container(state.file, state)
+
+    data, preview = read_container(state.file)
+    assert preview is None
+    assert data["map"]["image"] is None
+    assert set(data["map"]["removed_fog"]) == {(3, 4)}
+
+
+def test_container__newer_version(state):
+    write_container(state.file, state)
+    with zipfile.ZipFile(state.file) as archive:
+        files = {name: archive.read(name) for name in archive.namelist()}
+    meta = json.loads(files["meta.json"])
+    meta["version"] += 1
+    files["meta.json"] = json.dumps(meta).encode()
+    with zipfile.ZipFile(state.file, "w") as archive:
+        for name, data in files.items():
+            archive.writestr(name, data)
+
+    with pytest.raises(RuntimeError, match="newer version"):
+        read_container(state.file)
+
+
+def test_json__round_trip(state, tmp_path):
+    state.file = str(tmp_path / "map.json")
+    write_data_file(state)
+
+    with open(state.file) as f:
+        assert "removed_fog_spans" in json.load(f)["map"]
+    assert saved_parts(load(state.file)) == saved_parts(state)
+
+
+def test_legacy_json__next_to_container(state, tmp_path):
+    """Older .dndfog files are JSON, with every revealed cell listed, and pieces repeated for each cell they cover."""
+    legacy = {
+        "show": {"grid": True, "fog": False, "toolbar": False},
+        "map": {
+            "gridsize": 40,
+            "camera": [12, -7],
+            "image": {
+                "img": serialize_map(state.map.original_image),
+                "size": [300, 200],
+                "mode": "RGBA",
+                "zoom": [600, 400],
+            },
+            "image_offset": [0.5, -1.25],
+            "pieces": [
+                {"parent": [1, 2], "place": [1, 2], "color": [255, 0, 0], "size": 1, "show": True},
+                {"parent": [-4, 5], "place": [-4, 5], "color": [0, 255, 0], "size": 3, "show": True},
+                {"parent": [-4, 5], "place": [-3, 5], "color": [0, 255, 0], "size": 3, "show": False},
+            ],
+            "removed_fog": [list(cell) for cell in state.map.removed_fog],
+            "markings": [{"place": [80, 120], "color": [7, 8, 9], "size": 4}],
+            "fog_color": [204, 204, 204],
+            "grid_color": [197, 197, 197],
+        },
+    }
+    legacy_file = tmp_path / "legacy.dndfog"
+    legacy_file.write_text(json.dumps(legacy))
+    write_data_file(state)
+
+    assert not is_container(str(legacy_file))
+    old = load(str(legacy_file))
+    new = load(state.file)
+
+    old_parts, new_parts = saved_parts(old), saved_parts(new)
+    assert old_parts.pop("markings") == [(((2.0, 3.0),), 0.1, (7, 8, 9))]
+    new_parts.pop("markings")
+    assert old_parts == new_parts
+    assert {(piece.place, piece.size) for piece in old.map.pieces} == {((1, 2), PieceSize.small), ((-4, 5), PieceSize.large)}
+
+
+def test_legacy_json__saved_as_container(state, tmp_path):
+    legacy_file = tmp_path / "legacy.dndfog"
+    state.file = str(legacy_file)
+    legacy_file.write_text(json.dumps(state.to_json()))
+    assert not is_container(state.file)
+
+    loaded = load(state.file)
+    write_data_file(loaded)
+
+    assert is_container(state.file)
+    assert saved_parts(load(state.file)) == saved_parts(state)
+
+
+def test_background_map__zoomed_while_loading(state, tmp_path):
+    image_file = str(tmp_path / "map.png")
+    pygame.image.save(state.map.original_image, image_file)
+    loaded = ProgramState()
+
+    load_map(image_file, loaded)
+    zoom_loading_map(old_gridsize=40, new_gridsize=80)
+    zoom_loading_map(old_gridsize=80, new_gridsize=60)
+    finish_loading_map(loaded, wait=True)
+
+    assert loaded.map.original_image.get_size() == (300, 200)
+    assert loaded.map.image_size == (450, 300)
+
+
+def test_background_map__zoomed_while_loading_with_preview(state):
+    write_data_file(state)
+    loaded = ProgramState()
+
+    load_map(state.file, loaded)
+    loaded.map.image_size = (1200, 800)
+    zoom_loading_map(old_gridsize=40, new_gridsize=80)
+    finish_loading_map(loaded, wait=True)
+
+    assert loaded.map.image_size == (1200, 800)
+
+
+def test_pack_fog(display):
+    fog = FogChunks()
+    for y in range(64, 128):
+        fog.add_span(-64, y, 64)
+    fog.add_span(-3, 0, 70)
+    fog.add((1000, -1000))
+
+    full, chunks = pack_fog(fog)
+    unpacked = unpack_fog(full, chunks)
+
+    assert set(unpacked) == set(fog)
+    assert len(unpacked) == len(fog)
+    assert unpacked.to_chunks()[0] == [(-1, 1)]
+
+
+def test_pack_pieces(state):
+    pieces = unpack_pieces(pack_pieces(state))
+
+    assert {(piece["place"], piece["color"], piece["size"]) for piece in pieces} == {
+        ((1, 2), (255, 0, 0), PieceSize.small),
+        ((-4, 5), (0, 255, 0), PieceSize.large),
+    }
+
+
+def test_pack_markings(state):
+    markings = unpack_markings(pack_markings(state))
+
+    assert markings == list(state.map.markings.values())